@@ -1,13 +1,17 @@
 """
 Модели SQLAlchemy
 """
-from sqlalchemy import Column, Integer, String, DateTime, Text, ForeignKey, Boolean
+from sqlalchemy import Column, Integer, String, DateTime, Text, ForeignKey, Boolean, UniqueConstraint, Index
 from sqlalchemy.sql import func
 from database import Base
 
 
 class User(Base):
     __tablename__ = "users"
+    __table_args__ = (
+        UniqueConstraint("email", name="uq_users_email"),
+        UniqueConstraint("username", name="uq_users_username"),
+    )
 
     id = Column(Integer, primary_key=True)
     username = Column(String, nullable=False)
@@ -19,6 +23,10 @@ class User(Base):
 
 class Song(Base):
     __tablename__ = "songs"
+    __table_args__ = (
+        # выборка песен плейлиста и keyset-пагинация по id
+        Index("ix_songs_playlist_id", "playlist", "id"),
+    )
 
     id = Column(Integer, primary_key=True)
     author = Column(String, nullable=True)
@@ -34,6 +42,10 @@ class Song(Base):
 
 class Playlist(Base):
     __tablename__ = "playlists"
+    __table_args__ = (
+        # выборка плейлистов пользователя и keyset-пагинация по (created_at, id)
+        Index("ix_playlists_user_created_at_id", "user", "created_at", "id"),
+    )
 
     id = Column(Integer, primary_key=True)
     name = Column(String, nullable=False)
@@ -1,28 +1,46 @@
-from fastapi import APIRouter, Body, Depends, HTTPException, status
-from sqlalchemy import select, update, delete, and_
+from datetime import datetime
+from typing import Optional
+from fastapi import APIRouter, Body, Depends, HTTPException, Query, Response, status
+from sqlalchemy import select, insert, update, delete, and_, tuple_
 from sqlalchemy.ext.asyncio import AsyncSession
 from db_depends import get_async_db
 from app.models.models import User as UserModel, Playlist, Song
-from auth import hash_password, verify_password, create_access_token, create_refresh_token, get_current_user
+from auth import hash_password, verify_password, create_access_token, create_refresh_token, get_token_user
+from pagination import decode_cursor, page_size, set_next_cursor
+import config
 
 
 router = APIRouter(prefix='/playlists', tags=['Плейлисты', ])
 
 
 @router.get('')
-async def get_user_playlists(db: AsyncSession = Depends(get_async_db),
-                           current_user: UserModel = Depends(get_current_user)
-                           ):
+async def get_user_playlists(response: Response,
+                             cursor: Optional[str] = Query(None, description="Курсор следующей страницы (X-Next-Cursor)"),
+                             limit: Optional[int] = Query(None, gt=0, le=config.PAGE_SIZE_MAX, description="Размер страницы"),
+                             db: AsyncSession = Depends(get_async_db),
+                             current_user: UserModel = Depends(get_token_user)
+                             ):
     """All user's playlists"""
-    stmt = select(Playlist).where(Playlist.user == current_user.id)
+    limit = page_size(limit)
+    stmt = (select(Playlist)
+            .where(Playlist.user == current_user.id)
+            .order_by(Playlist.created_at, Playlist.id)
+            .limit(limit))
+    if cursor is not None:
+        stmt = stmt.where(tuple_(Playlist.created_at, Playlist.id) > tuple_(*decode_cursor(cursor, datetime, int)))
     playlists = (await db.execute(stmt)).scalars().all()
+    if playlists:
+        set_next_cursor(response, playlists, limit, playlists[-1].created_at, playlists[-1].id)
     return playlists
 
 
 @router.get('/{playlist_id}')
 async def get_playlist(playlist_id: int,
+                       response: Response,
+                       cursor: Optional[str] = Query(None, description="Курсор следующей страницы песен (X-Next-Cursor)"),
+                       limit: Optional[int] = Query(None, gt=0, le=config.PAGE_SIZE_MAX, description="Размер страницы песен"),
                        db: AsyncSession = Depends(get_async_db),
-                       current_user: UserModel = Depends(get_current_user)
+                       current_user: UserModel = Depends(get_token_user)
                        ):
     """Get playlist and it songs by id"""
     # Проверяем существование плейлиста и принадлежность пользователю
@@ -32,9 +50,15 @@ async def get_playlist(playlist_id: int,
     if not playlist:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Playlist not found")
 
-    # Находим все песни этого плейлиста
-    stmt = select(Song).where(Song.playlist == playlist_id)
+    # Находим песни этого плейлиста (постранично)
+    limit = page_size(limit)
+    stmt = select(Song).where(Song.playlist == playlist_id).order_by(Song.id).limit(limit)
+    if cursor is not None:
+        after_id, = decode_cursor(cursor, int)
+        stmt = stmt.where(Song.id > after_id)
     songs = (await db.execute(stmt)).scalars().all()
+    if songs:
+        set_next_cursor(response, songs, limit, songs[-1].id)
 
     return {
         "playlist": {
@@ -48,19 +72,16 @@ async def get_playlist(playlist_id: int,
 @router.post('', status_code=status.HTTP_201_CREATED)
 async def create_playlist(name: str = Body(embed=True),
                           db: AsyncSession = Depends(get_async_db),
-                          current_user: UserModel = Depends(get_current_user)):
+                          current_user: UserModel = Depends(get_token_user)):
     """Create a new playlist"""
-    db_item = Playlist(name=name, user=current_user.id)
+    # INSERT ... RETURNING сразу возвращает строку со значениями из базы (id, created_at),
+    # отдельный refresh не нужен
+    stmt = insert(Playlist).values(name=name, user=current_user.id).returning(Playlist)
+    db_item = await db.scalar(stmt)
 
-    # добавляет объект в сессию
-    db.add(db_item)
-
-    # фиксирует все изменения, сделанные в текущей сессии (выполняет запрос к БД)
+    # фиксирует все изменения, сделанные в текущей сессии
     await db.commit()
 
-    # обновляет состояние объекта db_item из базы данных
-    await db.refresh(db_item)
-
     return db_item
 
 
@@ -68,22 +89,21 @@ async def create_playlist(name: str = Body(embed=True),
 async def rename_playlist(playlist_id: int,
                           name: str,
                           db: AsyncSession = Depends(get_async_db),
-                          current_user: UserModel = Depends(get_current_user)
+                          current_user: UserModel = Depends(get_token_user)
                           ):
     """Rename playlist by id"""
-    # Проверяем существование плейлиста и принадлежность пользователю
-    stmt = select(Playlist).where(and_(Playlist.id == playlist_id, Playlist.user == current_user.id))
-    playlist = (await db.execute(stmt)).scalar_one_or_none()
+    # Проверка принадлежности пользователю и изменение - одним запросом
+    stmt = (update(Playlist)
+            .where(and_(Playlist.id == playlist_id, Playlist.user == current_user.id))
+            .values(name=name)
+            .returning(Playlist))
+    playlist = await db.scalar(stmt)
 
     if not playlist:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Playlist not found")
 
-    playlist.name = name
-
-    # фиксирует все изменения, сделанные в текущей сессии (выполняет запрос к БД)
+    # фиксирует все изменения, сделанные в текущей сессии
     await db.commit()
-    # обновляет состояние объекта db_item из базы данных
-    await db.refresh(playlist)
 
     return playlist
 
@@ -92,17 +112,18 @@ async def rename_playlist(playlist_id: int,
 @router.delete('/{playlist_id}')
 async def delete_playlist(playlist_id: int,
                           db: AsyncSession = Depends(get_async_db),
-                          current_user: UserModel = Depends(get_current_user)
+                          current_user: UserModel = Depends(get_token_user)
                           ):
     """Delete playlist by id"""
-    # Проверяем существование плейлиста и принадлежность пользователю
-    stmt = select(Playlist).where(and_(Playlist.id == playlist_id, Playlist.user == current_user.id))
-    playlist = (await db.execute(stmt)).scalar_one_or_none()
+    # Проверка принадлежности пользователю и удаление - одним запросом
+    stmt = (delete(Playlist)
+            .where(and_(Playlist.id == playlist_id, Playlist.user == current_user.id))
+            .returning(Playlist.id))
+    deleted = await db.scalar(stmt)
 
-    if not playlist:
+    if deleted is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Playlist not found")
 
-    await db.delete(playlist)
     # фиксирует все изменения, сделанные в текущей сессии (выполняет запрос к БД)
     await db.commit()
     return {'deleted': 'Playlist deleted'}
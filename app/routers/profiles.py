@@ -0,0 +1,32 @@
+import re
+from pathlib import Path
+from fastapi import APIRouter, Depends, Header, HTTPException, status
+from fastapi.responses import FileResponse
+from profiling import PROFILE_TOKEN_HEADER, check_profile_token
+import config
+
+
+router = APIRouter(prefix='/profiles', tags=['Профилирование', ])
+
+_PROFILE_ID = re.compile(r'^[A-Za-z0-9_-]+$')
+
+
+def require_profile_token(token: str | None = Header(None, alias=PROFILE_TOKEN_HEADER)):
+    if not check_profile_token(token, config.PROFILING_TOKEN):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Invalid profile token")
+
+
+@router.get('', dependencies=[Depends(require_profile_token)])
+async def list_profiles():
+    """Saved request profiles, newest first"""
+    paths = sorted(Path(config.PROFILING_DIR).glob('*.speedscope.json'), reverse=True)
+    return [path.name.removesuffix('.speedscope.json') for path in paths]
+
+
+@router.get('/{profile_id}', dependencies=[Depends(require_profile_token)])
+async def get_profile(profile_id: str):
+    """Download a profile in speedscope format"""
+    path = Path(config.PROFILING_DIR) / f'{profile_id}.speedscope.json'
+    if not _PROFILE_ID.match(profile_id) or not path.is_file():
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Profile not found")
+    return FileResponse(path, media_type='application/json', filename=path.name)
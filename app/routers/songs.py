@@ -1,36 +1,66 @@
-from fastapi import APIRouter, Body, Depends, HTTPException, status
+from typing import Optional
+import orjson
+from fastapi import APIRouter, Body, Depends, HTTPException, Query, Response, status
+from fastapi.responses import StreamingResponse
 from app.models.models import Song as SongModel, Playlist, User as UserModel
-from sqlalchemy import select, update, delete, and_
+from sqlalchemy import select, insert, update, delete, and_, literal
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
-from auth import hash_password, verify_password, create_access_token, create_refresh_token, get_current_user
+from auth import hash_password, verify_password, create_access_token, create_refresh_token, get_token_user
 from db_depends import get_async_db
-from schemas import SongCreate
+from database import async_session_maker
+from schemas import SongCreate, SongBulkCreate
+from pagination import decode_cursor, page_size, set_next_cursor
+import config
 
 
 router = APIRouter(prefix='/songs', tags=['Песни', ])
 
 
 @router.get('')
-async def get_all_user_songs(db: AsyncSession = Depends(get_async_db),
-                           current_user: UserModel = Depends(get_current_user)
-                           ):
+async def get_all_user_songs(response: Response,
+                             cursor: Optional[str] = Query(None, description="Курсор следующей страницы (X-Next-Cursor)"),
+                             limit: Optional[int] = Query(None, gt=0, le=config.PAGE_SIZE_MAX, description="Размер страницы"),
+                             stream: bool = Query(False, description="Отдать песни потоком в формате NDJSON"),
+                             db: AsyncSession = Depends(get_async_db),
+                             current_user: UserModel = Depends(get_token_user)
+                             ):
     """All user's songs"""
-    stmt = select(Playlist).where(Playlist.user == current_user.id)
-    playlists = (await db.execute(stmt)).scalars().all()
-
-    result = []
-    for playlist in playlists:
-        songs = (await db.execute(select(SongModel).where(SongModel.playlist == playlist.id))).scalars().all()
-        for song in songs:
-            result.append(song)
-
-    return result
+    # один запрос с JOIN вместо запроса на каждый плейлист; строки, а не ORM-объекты
+    stmt = (select(SongModel.__table__)
+            .join(Playlist, SongModel.playlist == Playlist.id)
+            .where(Playlist.user == current_user.id)
+            .order_by(SongModel.id))
+    if cursor is not None:
+        after_id, = decode_cursor(cursor, int)
+        stmt = stmt.where(SongModel.id > after_id)
+
+    if stream:
+        # поток по умолчанию не ограничен: память не растёт с размером библиотеки
+        if limit is not None:
+            stmt = stmt.limit(limit)
+        return StreamingResponse(_stream_ndjson(stmt), media_type="application/x-ndjson")
+
+    limit = page_size(limit)
+    songs = [dict(row) for row in (await db.execute(stmt.limit(limit))).mappings()]
+    if songs:
+        set_next_cursor(response, songs, limit, songs[-1]["id"])
+    return songs
+
+
+async def _stream_ndjson(stmt):
+    # своя сессия: ответ читается уже после выхода из обработчика,
+    # строки идут с серверного курсора и не накапливаются в памяти
+    async with async_session_maker() as session:
+        result = await session.stream(stmt)
+        async for row in result.mappings():
+            yield orjson.dumps(dict(row)) + b"\n"
 
 
 @router.get('/{song_id}')
 async def get_song(song_id: int,
                    db: AsyncSession = Depends(get_async_db),
-                   current_user: UserModel = Depends(get_current_user)
+                   current_user: UserModel = Depends(get_token_user)
                    ):
     """Get song by id"""
     # Проверяем существование песни
@@ -47,76 +77,105 @@ async def get_song(song_id: int,
 @router.post('', status_code=status.HTTP_201_CREATED)
 async def create_song(song_data: SongCreate,
                       db: AsyncSession = Depends(get_async_db),
-                      current_user: UserModel = Depends(get_current_user)
+                      current_user: UserModel = Depends(get_token_user)
                       ):
     """Create a new song"""
-    # Проверяем, есть ли у данного пользователя такой плейлист
-    stmt = select(Playlist).where(Playlist.id == song_data.playlist_id, Playlist.user == current_user.id)
-    playlist = (await db.execute(stmt)).scalar_one_or_none()
+    songs_table = SongModel.__table__
+    values = song_data.model_dump(exclude={"playlist_id"})
+
+    # INSERT ... SELECT ... FROM playlists WHERE id = ? AND user = ? RETURNING:
+    # строка вставится, только если у данного пользователя есть такой плейлист
+    owned_playlist = (select(*(literal(value, songs_table.c[column].type) for column, value in values.items()),
+                             Playlist.id)
+                      .where(Playlist.id == song_data.playlist_id, Playlist.user == current_user.id))
+    stmt = (insert(songs_table)
+            .from_select([*values, "playlist"], owned_playlist)
+            .returning(*songs_table.c))
+    song = (await db.execute(stmt)).mappings().one_or_none()
 
-    if not playlist:
+    if not song:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Playlist not found or does not belong to the user")
 
-    db_item = SongModel(name=song_data.name,
-                   duration_text=song_data.duration_text,
-                   duration=song_data.duration,
-                   url=song_data.url,
-                   author=song_data.author,
-                   album=song_data.album,
-                   bitrate=song_data.bitrate,
-                   album_cover_url=song_data.album_cover_url,
-                   playlist=song_data.playlist_id
-                   )
-
-    # добавляет объект в сессию
-    db.add(db_item)
-
-    # фиксирует все изменения, сделанные в текущей сессии (выполняет запрос к БД)
+    # фиксирует все изменения, сделанные в текущей сессии
     await db.commit()
 
-    # обновляет состояние объекта db_item из базы данных
-    await db.refresh(db_item)
+    return dict(song)
+
+
+@router.post('/bulk', status_code=status.HTTP_201_CREATED)
+async def create_songs_bulk(data: SongBulkCreate,
+                            db: AsyncSession = Depends(get_async_db),
+                            current_user: UserModel = Depends(get_token_user)
+                            ):
+    """Add many songs to a playlist at once"""
+    # Принадлежность плейлиста проверяем один раз на всю пачку
+    stmt = select(Playlist.id).where(Playlist.id == data.playlist_id, Playlist.user == current_user.id)
+    if (await db.execute(stmt)).scalar_one_or_none() is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Playlist not found or does not belong to the user")
+
+    rows = [{**song.model_dump(), "playlist": data.playlist_id} for song in data.songs]
+
+    # многострочный INSERT ... RETURNING (SQLAlchemy сам бьёт большие пачки на несколько
+    # выражений) в одной транзакции, без refresh каждой строки.
+    # Если плейлист удалили между проверкой и вставкой, внешний ключ songs_playlist_fkey
+    # не пропустит строки - отвечаем так же, как если бы плейлиста не было
+    songs_table = SongModel.__table__
+    try:
+        result = await db.execute(insert(songs_table).returning(*songs_table.c), rows)
+        songs = [dict(row) for row in result.mappings()]
+        await db.commit()
+    except IntegrityError as e:
+        await db.rollback()
+        if "songs_playlist_fkey" not in str(e.orig):
+            raise
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Playlist not found or does not belong to the user")
 
-    return db_item
+    return songs
 
 
 @router.patch('/{song_id}')
 async def rename_song(song_id: int,
                       name: str,
                       db: AsyncSession = Depends(get_async_db),
-                      current_user: UserModel = Depends(get_current_user)
+                      current_user: UserModel = Depends(get_token_user)
                       ):
     """Rename song by id"""
-    # Проверяем существование песни
-    stmt = select(SongModel).where(SongModel.id == song_id)
-    song = (await db.execute(stmt)).scalar_one_or_none()
+    # UPDATE songs ... FROM playlists: песня меняется, только если её плейлист принадлежит пользователю
+    songs_table = SongModel.__table__
+    stmt = (update(songs_table)
+            .where(songs_table.c.id == song_id,
+                   songs_table.c.playlist == Playlist.id,
+                   Playlist.user == current_user.id)
+            .values(name=name)
+            .returning(*songs_table.c))
+    song = (await db.execute(stmt)).mappings().one_or_none()
 
     if not song:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Song not found")
 
-    song.name = name
-
-    # фиксирует все изменения, сделанные в текущей сессии (выполняет запрос к БД)
+    # фиксирует все изменения, сделанные в текущей сессии
     await db.commit()
-    # обновляет состояние объекта db_item из базы данных
-    await db.refresh(song)
 
-    return song
+    return dict(song)
 
 
 @router.delete('/{song_id}')
 async def delete_song(song_id: int,
                    db: AsyncSession = Depends(get_async_db),
-                   current_user: UserModel = Depends(get_current_user)
+                   current_user: UserModel = Depends(get_token_user)
                    ):
-    """Get song by id"""
-    # Проверяем существование песни
-    stmt = select(SongModel).where(SongModel.id == song_id)
-    song = (await db.execute(stmt)).scalar_one_or_none()
-
-    if not song:
+    """Delete song by id"""
+    # DELETE ... USING playlists: удаляем, только если плейлист песни принадлежит пользователю
+    songs_table = SongModel.__table__
+    stmt = (delete(songs_table)
+            .where(songs_table.c.id == song_id,
+                   songs_table.c.playlist == Playlist.id,
+                   Playlist.user == current_user.id)
+            .returning(songs_table.c.id))
+    deleted = await db.scalar(stmt)
+
+    if deleted is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Song not found")
 
-    await db.delete(song)
     await db.commit()
     return {'deleted': 'Song deleted'}
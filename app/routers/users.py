@@ -3,12 +3,14 @@ from typing import Optional
 from fastapi import APIRouter, Depends, HTTPException, status, Response, Cookie
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
 from fastapi.security import OAuth2PasswordRequestForm
 
 from app.models.models import User as UserModel
 from schemas import UserCreate, User as UserSchema
 from db_depends import get_async_db
-from auth import hash_password, verify_password, create_access_token, create_refresh_token, get_current_user
+from auth import hash_password_async, verify_password_async, create_access_token, create_refresh_token, get_current_user
+from auth import revoke_user, revoke_access_token
 from config import SECRET_KEY, ALGORITHM, ACCESS_TOKEN_EXPIRE_MINUTES, REFRESH_TOKEN_EXPIRE_DAYS
 from jwt.exceptions import InvalidTokenError, ExpiredSignatureError, PyJWTError
 
@@ -21,28 +23,27 @@ async def create_user(user: UserCreate, db: AsyncSession = Depends(get_async_db)
     """
     Регистрирует нового пользователя
     """
-    # Проверка уникальности email
-    result = await db.scalars(select(UserModel).where(UserModel.email == user.email))
-    if result.first():
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
-                            detail="Email already registered")
-
-    # Проверка уникальности username
-    result = await db.scalars(select(UserModel).where(UserModel.username == user.username))
-    if result.first():
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
-                            detail="Username already registered")
-
     # Создание объекта пользователя с хешированным паролем
     db_user = UserModel(
         username=user.username,
         email=str(user.email),
-        password=hash_password(user.password)
+        password=await hash_password_async(user.password)
     )
 
-    # Добавление в сессию и сохранение в базе
+    # Добавление в сессию и сохранение в базе.
+    # Уникальность email и username проверяет сама база (uq_users_email, uq_users_username)
     db.add(db_user)
-    await db.commit()
+    try:
+        await db.commit()
+    except IntegrityError as e:
+        await db.rollback()
+        if "uq_users_email" in str(e.orig):
+            detail = "Email already registered"
+        elif "uq_users_username" in str(e.orig):
+            detail = "Username already registered"
+        else:
+            raise
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=detail)
     return db_user
 
 
@@ -54,9 +55,9 @@ async def login(response: Response,
     Аутентифицирует пользователя и устанавливает куки access_token и refresh_token
     """
     # OAuth2PasswordRequestForm - это форма ("Content-Type": "application/x-www-form-urlencoded")
-    result = await db.scalars(select(UserModel).where(UserModel.email == form_data.username))
+    result = await db.scalars(select(UserModel).where(UserModel.email == form_data.username, UserModel.is_active == True))
     user = result.first()
-    if not user or not verify_password(form_data.password, user.password):
+    if not user or not await verify_password_async(form_data.password, user.password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password",
@@ -87,11 +88,7 @@ async def login(response: Response,
     return {"success": True}
 
 
-@router.post("/logout")
-async def logout(response: Response):
-    """
-    Удаляет куки клиента, тем самым разлогинивая его
-    """
+def _delete_auth_cookies(response: Response) -> None:
     response.delete_cookie(
         key="access_token",
         httponly=True,
@@ -104,9 +101,33 @@ async def logout(response: Response):
         secure=False,
         samesite="lax",
     )
+
+
+@router.post("/logout")
+async def logout(response: Response, access_token: Optional[str] = Cookie(None)):
+    """
+    Удаляет куки клиента и отзывает его access-токен, тем самым разлогинивая его.
+    Сессии на других устройствах остаются
+    """
+    if access_token is not None:
+        await revoke_access_token(access_token)
+    _delete_auth_cookies(response)
     return {"success": True}
 
 
+@router.delete("/me")
+async def deactivate_current_user(response: Response,
+                                  current_user: UserModel = Depends(get_current_user),
+                                  db: AsyncSession = Depends(get_async_db)):
+    """
+    Деактивирует учётную запись текущего пользователя и отзывает его токены
+    """
+    current_user.is_active = False
+    await db.commit()
+    await revoke_user(current_user.id)
+    _delete_auth_cookies(response)
+    return {"success": True}
+
 
 @router.post("/refresh-token")
 async def refresh_token(response: Response, refresh_token: Optional[str] = Cookie(None), db: AsyncSession = Depends(get_async_db)):
@@ -1,5 +1,11 @@
 import os
+import time
+import uuid
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 
+import redis
+from loguru import logger
 from passlib.context import CryptContext
 from fastapi.security import OAuth2PasswordBearer
 from datetime import datetime, timedelta, timezone
@@ -12,13 +18,34 @@ from typing import Optional
 
 from app.models.models import User as UserModel
 from config import SECRET_KEY, ALGORITHM, ACCESS_TOKEN_EXPIRE_MINUTES, REFRESH_TOKEN_EXPIRE_DAYS
+from config import AUTH_STATELESS, AUTH_REVOCATION_REFRESH, PASSWORD_HASH_WORKERS, PASSWORD_HASH_QUEUE
+from database import async_session_maker
 from db_depends import get_async_db
+from redis_cache import redis_client
+from schemas import TokenUser
 
 # Создаём контекст для хеширования с использованием bcrypt
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="users/token")
 
+# bcrypt занимает ~250 мс CPU и отпускает GIL - считаем его в отдельных потоках,
+# чтобы не блокировать event loop воркера
+_password_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt")
+# сколько операций с паролями сейчас выполняется или ждёт в очереди
+_password_jobs = 0
+
+# id пользователей, чьи access-токены, выданные раньше score (время отзыва), не принимаются
+REVOKED_USERS_KEY = "auth:revoked"
+
+# jti отдельных отозванных access-токенов (выход с одного устройства), score - когда токен истекает
+REVOKED_TOKENS_KEY = "auth:revoked_tokens"
+
+# копии списков отзыва в памяти воркера: id пользователя -> время отзыва и jti токенов
+_revoked_users: dict[int, float] = {}
+_revoked_tokens: set[str] = set()
+_revoked_synced_at = 0.0
+
 
 def hash_password(password: str) -> str:
     """
@@ -34,13 +61,47 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
 
+async def _run_password_job(fn, *args):
+    """
+    Выполняет bcrypt-операцию в пуле потоков. Если очередь переполнена, сразу отвечает 503,
+    а не копит запросы.
+    """
+    global _password_jobs
+    if _password_jobs >= PASSWORD_HASH_WORKERS + PASSWORD_HASH_QUEUE:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Server is busy, try again later",
+            headers={"Retry-After": "1"},
+        )
+    _password_jobs += 1
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_password_executor, fn, *args)
+    finally:
+        _password_jobs -= 1
+
+
+async def hash_password_async(password: str) -> str:
+    """
+    hash_password в пуле потоков, не блокируя event loop.
+    """
+    return await _run_password_job(hash_password, password)
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """
+    verify_password в пуле потоков, не блокируя event loop.
+    """
+    return await _run_password_job(verify_password, plain_password, hashed_password)
+
+
 def create_access_token(data: dict):
     """
-    Создаёт JWT с payload (sub, role, id, exp).
+    Создаёт JWT с payload (sub, role, id, jti, iat, exp).
     """
     to_encode = data.copy()
     expire = datetime.now(timezone.utc) + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    to_encode.update({"exp": expire})
+    # iat с дробной частью: токен, выданный сразу после отзыва, не должен считаться отозванным
+    to_encode.update({"jti": uuid.uuid4().hex, "iat": time.time(), "exp": expire})
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
 
@@ -69,22 +130,20 @@ async def get_token_from_cookie(access_token: Optional[str] = Cookie(None), refr
     return access_token
 
 
-async def get_current_user(token: str = Depends(get_token_from_cookie),
-                           db: AsyncSession = Depends(get_async_db)):
-    # token: str = Depends(oauth2_scheme)  для авторизации по заголовкам
-    """
-    Проверяет JWT и возвращает пользователя из базы.
-    """
-    credentials_exception = HTTPException(
+def _credentials_exception() -> HTTPException:
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+
+
+def decode_access_token(token: str) -> dict:
+    """
+    Проверяет подпись и срок действия JWT и возвращает его payload.
+    """
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email: str = payload.get("sub")
-        if email is None:
-            raise credentials_exception
     except jwt.ExpiredSignatureError:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -92,10 +151,110 @@ async def get_current_user(token: str = Depends(get_token_from_cookie),
             headers={"WWW-Authenticate": "Bearer"},
         )
     except jwt.PyJWTError:
-        raise credentials_exception
+        raise _credentials_exception()
+    if payload.get("sub") is None:
+        raise _credentials_exception()
+    return payload
+
+
+async def get_current_user(token: str = Depends(get_token_from_cookie),
+                           db: AsyncSession = Depends(get_async_db)):
+    # token: str = Depends(oauth2_scheme)  для авторизации по заголовкам
+    """
+    Проверяет JWT и возвращает пользователя из базы.
+    """
+    email: str = decode_access_token(token)["sub"]
     result = await db.scalars(
         select(UserModel).where(UserModel.email == email, UserModel.is_active == True))
     user = result.first()
     if user is None:
-        raise credentials_exception
+        raise _credentials_exception()
     return user
+
+
+async def revoke_user(user_id: int) -> None:
+    """
+    Отзывает все уже выданные access-токены пользователя на всех устройствах (при деактивации).
+    Токены, выданные после отзыва, принимаются как обычно.
+    """
+    revoked_at = time.time()
+    await redis_client.zadd(REVOKED_USERS_KEY, {str(user_id): revoked_at})
+    _revoked_users[user_id] = revoked_at
+
+
+async def revoke_access_token(token: str) -> None:
+    """
+    Отзывает один access-токен (выход с этого устройства). Список отзыва читает только
+    stateless-авторизация, поэтому без AUTH_STATELESS в Redis ничего не пишется.
+    Истёкший или невалидный токен отзывать не нужно.
+    """
+    if not AUTH_STATELESS:
+        return
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except jwt.PyJWTError:
+        return
+    jti = payload.get("jti")
+    if jti is None:
+        # токен выдан до появления jti и истечёт сам не позже чем через ACCESS_TOKEN_EXPIRE_MINUTES
+        return
+    await redis_client.zadd(REVOKED_TOKENS_KEY, {jti: payload["exp"]})
+    _revoked_tokens.add(jti)
+
+
+async def _sync_revocations() -> None:
+    global _revoked_users, _revoked_tokens, _revoked_synced_at
+    now = time.time()
+    if now - _revoked_synced_at < AUTH_REVOCATION_REFRESH:
+        return
+    # и при ошибке: пока Redis недоступен, не ходим в него на каждый запрос
+    _revoked_synced_at = now
+    try:
+        # токены, выданные раньше, чем срок жизни access-токена назад, уже истекли сами
+        async with redis_client.pipeline(transaction=False) as pipe:
+            pipe.zremrangebyscore(REVOKED_USERS_KEY, "-inf", now - 60 * ACCESS_TOKEN_EXPIRE_MINUTES)
+            pipe.zrange(REVOKED_USERS_KEY, 0, -1, withscores=True)
+            pipe.zremrangebyscore(REVOKED_TOKENS_KEY, "-inf", now)
+            pipe.zrange(REVOKED_TOKENS_KEY, 0, -1)
+            _, members, _, tokens = await pipe.execute()
+    except redis.RedisError as e:
+        # без Redis проверяем по последней полученной копии списков
+        logger.warning(f"revoked tokens not synced: {e!r}")
+        return
+    _revoked_users = {int(member): revoked_at for member, revoked_at in members}
+    _revoked_tokens = {token.decode() for token in tokens}
+
+
+async def _is_revoked(payload: dict) -> bool:
+    await _sync_revocations()
+    if payload.get("jti") in _revoked_tokens:
+        return True
+    revoked_at = _revoked_users.get(payload["id"])
+    issued_at = payload.get("iat")
+    # токен без iat выдан до появления отзыва - считаем его выданным раньше
+    return revoked_at is not None and (issued_at is None or issued_at <= revoked_at)
+
+
+async def _get_user_from_db(token: str):
+    # сессия открывается только здесь, а не зависимостью, - stateless-путь базу не трогает
+    async with async_session_maker() as db:
+        return await get_current_user(token, db)
+
+
+async def get_token_user(token: str = Depends(get_token_from_cookie)):
+    """
+    Как get_current_user, но при AUTH_STATELESS не ходит в базу: доверяет подписанным
+    claims токена (id, sub, username) и проверяет только список отозванных пользователей.
+    Для эндпоинтов, которым нужен лишь id пользователя.
+    """
+    if not AUTH_STATELESS:
+        return await _get_user_from_db(token)
+
+    payload = decode_access_token(token)
+    user_id, username = payload.get("id"), payload.get("username")
+    if user_id is None or username is None:
+        # токен выдан до появления этих claims
+        return await _get_user_from_db(token)
+    if await _is_revoked(payload):
+        raise _credentials_exception()
+    return TokenUser(id=user_id, email=payload["sub"], username=username)
@@ -0,0 +1,89 @@
+"""
+p50/p99 задержки закешированного /search авторизованного пользователя: с запросом
+пользователя из базы на каждый запрос (get_current_user) и без него (AUTH_STATELESS, только
+подпись JWT и список отозванных). Ответ отдаётся из L1, так что разница - стоимость
+похода в базу. Приложение запускается в процессе (с lifespan), запросы идут через
+httpx.ASGITransport.
+
+Запуск из корня проекта (нужны Redis и база из .env с применёнными миграциями):
+    python -m benchmarks.auth_lookup --requests 5000
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import time
+import uuid
+
+# лимитер не должен отклонять запросы бенчмарка
+os.environ['THROTTLING_LIMIT'] = '1000000000'
+os.environ['THROTTLING_LOCAL_PRECHECK'] = 'False'
+
+import httpx
+from sqlalchemy import delete
+
+import auth
+import main
+import redis_cache
+from app.models.models import User as UserModel
+from auth import create_access_token
+from benchmarks.cached_search_serialization import make_payload
+from database import async_session_maker
+
+QUERY = 'bench auth lookup'
+
+
+async def measure(client: httpx.AsyncClient, requests: int) -> list[float]:
+    for _ in range(100):
+        (await client.get('/search', params={'q': QUERY})).raise_for_status()
+    latencies = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        resp = await client.get('/search', params={'q': QUERY})
+        latencies.append(time.perf_counter() - start)
+        resp.raise_for_status()
+    return latencies
+
+
+def report(name: str, latencies: list[float]) -> None:
+    q = statistics.quantiles(latencies, n=100, method='inclusive')
+    print(f'{name:<18} p50={q[49] * 1000:7.3f} ms  p99={q[98] * 1000:7.3f} ms')
+
+
+async def run(requests: int) -> None:
+    key = redis_cache.make_cache_key(QUERY, 'mailru')
+    await redis_cache.cache_set(key, make_payload(100), 300)
+
+    # пароль не проверяется - токен выдаём сами
+    user = UserModel(username=f'bench-{uuid.uuid4().hex[:8]}', email=f'bench-{uuid.uuid4().hex[:8]}@example.com',
+                     password='-')
+    async with async_session_maker() as db:
+        db.add(user)
+        await db.commit()
+    token = create_access_token({'sub': user.email, 'id': user.id, 'username': user.username})
+
+    transport = httpx.ASGITransport(app=main.app)
+    try:
+        async with main.lifespan(main.app):
+            async with httpx.AsyncClient(transport=transport, base_url='http://bench',
+                                         cookies={'access_token': token}) as client:
+                auth.AUTH_STATELESS = False
+                with_db = await measure(client, requests)
+                auth.AUTH_STATELESS = True
+                without_db = await measure(client, requests)
+    finally:
+        await redis_cache.redis_client.delete(key)
+        async with async_session_maker() as db:
+            await db.execute(delete(UserModel).where(UserModel.id == user.id))
+            await db.commit()
+
+    print(f'requests={requests}')
+    report('DB user lookup:', with_db)
+    report('stateless JWT:', without_db)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, default=5000)
+    args = parser.parse_args()
+    asyncio.run(run(args.requests))
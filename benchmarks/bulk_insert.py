@@ -0,0 +1,75 @@
+"""
+Добавление N песен в плейлист: N вызовов POST /songs против одного POST /songs/bulk.
+Обработчики вызываются напрямую с сессией базы, без HTTP и авторизации.
+
+Для замера создаются временные пользователь и плейлист, в конце они удаляются
+(песни удаляются каскадно).
+
+Запуск из корня проекта (нужен Postgres из .env):
+    python -m benchmarks.bulk_insert --songs 1000
+"""
+import argparse
+import asyncio
+import time
+import uuid
+
+from sqlalchemy import delete
+
+from app.models.models import User as UserModel, Playlist
+from app.routers.songs import create_song, create_songs_bulk
+from database import async_session_maker, async_engine
+from schemas import SongCreate, SongBulkCreate, SongItem
+
+
+def make_song(i: int) -> dict:
+    return {
+        'name': f'Песня {i}',
+        'author': 'Rammstein',
+        'album': 'Mutter',
+        'bitrate': 320,
+        'duration_text': '04:32',
+        'duration': 272,
+        'album_cover_url': f'https://musicimg.mail.ru/cover/{i}.jpg',
+        'url': f'https://my.mail.ru/music/songs/{i}',
+    }
+
+
+async def main(count: int) -> None:
+    suffix = uuid.uuid4().hex[:8]
+    async with async_session_maker() as db:
+        user = UserModel(username=f'bench_{suffix}', email=f'bench_{suffix}@example.com', password='x')
+        db.add(user)
+        await db.flush()
+        single, bulk = Playlist(name='single', user=user.id), Playlist(name='bulk', user=user.id)
+        db.add_all([single, bulk])
+        await db.commit()
+
+    try:
+        async with async_session_maker() as db:
+            start = time.perf_counter()
+            for i in range(count):
+                await create_song(SongCreate(**make_song(i), playlist_id=single.id), db=db, current_user=user)
+            single_time = time.perf_counter() - start
+
+        async with async_session_maker() as db:
+            data = SongBulkCreate(playlist_id=bulk.id, songs=[SongItem(**make_song(i)) for i in range(count)])
+            start = time.perf_counter()
+            await create_songs_bulk(data, db=db, current_user=user)
+            bulk_time = time.perf_counter() - start
+    finally:
+        async with async_session_maker() as db:
+            await db.execute(delete(UserModel).where(UserModel.id == user.id))
+            await db.commit()
+        await async_engine.dispose()
+
+    print(f'songs={count}')
+    print(f'{count} x POST /songs:  {single_time:8.3f} s  ({count / single_time:8.1f} songs/s)')
+    print(f'1 x POST /songs/bulk: {bulk_time:8.3f} s  ({count / bulk_time:8.1f} songs/s)')
+    print(f'speedup: x{single_time / bulk_time:.1f}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--songs', type=int, default=1000)
+    args = parser.parse_args()
+    asyncio.run(main(args.songs))
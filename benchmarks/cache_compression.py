@@ -0,0 +1,74 @@
+"""
+Степень сжатия и время кодирования/декодирования значений кеша поиска.
+
+Корпус - записанные ответы /search: JSONL-файл (по ответу на строку) или
+значения search:* прямо из Redis.
+
+Запуск из корня проекта:
+    python -m benchmarks.cache_compression --corpus responses.jsonl
+    python -m benchmarks.cache_compression --redis
+"""
+import argparse
+import asyncio
+import time
+import zlib
+
+import orjson
+
+
+def load_corpus(path: str) -> list[bytes]:
+    with open(path, 'rb') as f:
+        # перекодируем orjson-ом, чтобы мерить ровно те байты, что кладёт cache_set
+        return [orjson.dumps(orjson.loads(line)) for line in f if line.strip()]
+
+
+async def load_from_redis(limit: int) -> list[bytes]:
+    from redis_cache import redis_client, _unpack
+
+    corpus = []
+    async for key in redis_client.scan_iter(match='search:*', count=500):
+        data = await redis_client.get(key)
+        if data:
+            corpus.append(_unpack(data))
+        if len(corpus) >= limit:
+            break
+    return corpus
+
+
+def report(corpus: list[bytes], levels: list[int], rounds: int) -> None:
+    raw_size = sum(len(d) for d in corpus)
+    print(f'entries={len(corpus)} raw={raw_size / 1024:.1f} KiB avg={raw_size / len(corpus):.0f} B')
+    print(f'{"level":>5} {"ratio":>7} {"encode, us":>11} {"decode, us":>11}')
+    for level in levels:
+        start = time.perf_counter()
+        for _ in range(rounds):
+            packed = [zlib.compress(d, level) for d in corpus]
+        encode = (time.perf_counter() - start) / rounds / len(corpus)
+
+        start = time.perf_counter()
+        for _ in range(rounds):
+            for p in packed:
+                zlib.decompress(p)
+        decode = (time.perf_counter() - start) / rounds / len(corpus)
+
+        ratio = raw_size / sum(len(p) for p in packed)
+        print(f'{level:>5} {ratio:>7.2f} {encode * 1e6:>11.1f} {decode * 1e6:>11.1f}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--corpus', help='JSONL с записанными ответами /search')
+    source.add_argument('--redis', action='store_true', help='взять значения search:* из Redis')
+    parser.add_argument('--limit', type=int, default=1000)
+    parser.add_argument('--levels', type=int, nargs='+', default=[1, 3, 6, 9])
+    parser.add_argument('--rounds', type=int, default=5)
+    args = parser.parse_args()
+
+    if args.redis:
+        corpus = asyncio.run(load_from_redis(args.limit))
+    else:
+        corpus = load_corpus(args.corpus)[:args.limit]
+    if not corpus:
+        raise SystemExit('corpus is empty')
+    report(corpus, args.levels, args.rounds)
@@ -0,0 +1,84 @@
+"""
+p50/p99 задержки закешированного /search против локального redis-server: проверка лимита
+и чтение кеша отдельными запросами в Redis против одного совмещённого round trip.
+L1 отключается, чтобы каждый запрос доходил до Redis. Приложение запускается в процессе
+(с lifespan), запросы идут через httpx.ASGITransport.
+
+Запуск из корня проекта (нужен Redis из REDIS_HOST/REDIS_PORT, база не нужна):
+    python -m benchmarks.cached_search_latency --requests 5000
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import time
+
+# лимитер не должен отклонять запросы бенчмарка, авторизация - без похода в базу
+os.environ['THROTTLING_LIMIT'] = '1000000000'
+os.environ['THROTTLING_LOCAL_PRECHECK'] = 'False'
+os.environ['AUTH_STATELESS'] = 'True'
+
+import httpx
+
+import main
+import redis_cache
+from auth import create_access_token
+from middlewares import ThrottlingMiddleware
+from benchmarks.cached_search_serialization import make_payload
+
+QUERY = 'bench cached search'
+
+
+def set_probe(enabled: bool) -> None:
+    # стек middleware собирается при первом запросе, поэтому пересобираем его
+    for middleware in main.app.user_middleware:
+        if middleware.cls is ThrottlingMiddleware:
+            middleware.kwargs['probe_key'] = main.search_probe_key if enabled else None
+    main.app.middleware_stack = None
+
+
+async def measure(client: httpx.AsyncClient, requests: int) -> list[float]:
+    for _ in range(100):
+        (await client.get('/search', params={'q': QUERY})).raise_for_status()
+    latencies = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        resp = await client.get('/search', params={'q': QUERY})
+        latencies.append(time.perf_counter() - start)
+        resp.raise_for_status()
+    return latencies
+
+
+def report(name: str, latencies: list[float]) -> None:
+    q = statistics.quantiles(latencies, n=100)
+    print(f'{name:<22} p50={q[49] * 1000:7.3f} ms  p99={q[98] * 1000:7.3f} ms')
+
+
+async def run(requests: int, items: int) -> None:
+    redis_cache.local_cache.max_entries = 0
+    redis_cache.local_cache.clear()
+    key = redis_cache.make_cache_key(QUERY, 'mailru')
+    await redis_cache.cache_set(key, make_payload(items), 300)
+
+    token = create_access_token({'sub': 'bench@example.com', 'id': 1, 'username': 'bench'})
+    transport = httpx.ASGITransport(app=main.app)
+    async with main.lifespan(main.app):
+        async with httpx.AsyncClient(transport=transport, base_url='http://bench',
+                                     cookies={'access_token': token}) as client:
+            set_probe(False)
+            separate = await measure(client, requests)
+            set_probe(True)
+            combined = await measure(client, requests)
+    await redis_cache.redis_client.delete(key)
+
+    print(f'items={items} requests={requests}')
+    report('separate round trips:', separate)
+    report('single round trip:', combined)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--items', type=int, default=100)
+    args = parser.parse_args()
+    asyncio.run(run(args.requests, args.items))
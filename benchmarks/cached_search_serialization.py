@@ -0,0 +1,81 @@
+"""
+Микро-бенчмарк отдачи закешированного ответа /search на 300 элементов:
+старый путь (json.loads строки из Redis + сериализация FastAPI) против
+нового (готовые orjson-байты отдаются как есть).
+
+Запуск из корня проекта:
+    python -m benchmarks.cached_search_serialization --requests 2000
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import httpx
+import orjson
+from fastapi import FastAPI, Response
+
+
+def make_payload(count: int = 300) -> list[dict]:
+    return [
+        {
+            'name': f'Песня номер {i}',
+            'author': 'Rammstein',
+            'album': 'Mutter',
+            'bitrate': 320,
+            'duration_text': '04:32',
+            'duration': 272,
+            'album_cover_url': f'https://musicimg.mail.ru/cover/{i}.jpg',
+            'url': f'https://my.mail.ru/music/songs/{i}',
+        }
+        for i in range(count)
+    ]
+
+
+def make_app(items: list[dict]) -> FastAPI:
+    # так значение лежало в Redis раньше (decode_responses=True) и так лежит теперь
+    cached_str = json.dumps(items, ensure_ascii=False)
+    cached_bytes = orjson.dumps(items)
+
+    app = FastAPI()
+
+    @app.get('/old')
+    async def old():
+        return json.loads(cached_str)
+
+    @app.get('/new')
+    async def new():
+        return Response(content=cached_bytes, media_type='application/json')
+
+    return app
+
+
+async def measure(client: httpx.AsyncClient, path: str, requests: int) -> float:
+    # прогрев
+    for _ in range(50):
+        await client.get(path)
+    start = time.perf_counter()
+    for _ in range(requests):
+        resp = await client.get(path)
+        resp.raise_for_status()
+    return requests / (time.perf_counter() - start)
+
+
+async def main(requests: int, count: int) -> None:
+    app = make_app(make_payload(count))
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url='http://bench') as client:
+        old_rps = await measure(client, '/old', requests)
+        new_rps = await measure(client, '/new', requests)
+    print(f'items={count} requests={requests}')
+    print(f'old (json.loads + jsonable_encoder): {old_rps:10.1f} req/s')
+    print(f'new (raw orjson bytes):              {new_rps:10.1f} req/s')
+    print(f'speedup: x{new_rps / old_rps:.2f}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--items', type=int, default=300)
+    args = parser.parse_args()
+    asyncio.run(main(args.requests, args.items))
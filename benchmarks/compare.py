@@ -0,0 +1,65 @@
+"""
+Сравнение двух результатов benchmarks.load_test: пропускная способность и p50/p95/p99 по
+сценариям и время в зависимостях на запрос. С --threshold код выхода 1, если какой-то
+показатель ухудшился больше чем на заданный процент (для проверки регрессий в CI).
+
+Запуск из корня проекта:
+    python -m benchmarks.compare benchmarks/results/<было>.json benchmarks/results/<стало>.json --threshold 10
+"""
+import argparse
+import sys
+from pathlib import Path
+
+import orjson
+
+# показатель -> больше ли значение - лучше
+SCENARIO_FIELDS = {'throughput': True, 'p50_ms': False, 'p95_ms': False, 'p99_ms': False}
+
+
+def change(old: float, new: float) -> float | None:
+    return (new - old) / old * 100 if old else None
+
+
+def compare(old: dict, new: dict, threshold: float | None) -> list[str]:
+    """Печатает сравнение и возвращает список регрессий сверх threshold процентов."""
+    regressions = []
+    print(f"{old['git_sha']} -> {new['git_sha']}")
+    if old['params'] != new['params']:
+        print('warning: runs used different parameters, numbers may not be comparable')
+
+    print(f"{'scenario':<15}{'metric':<12}{'old':>10}{'new':>10}{'change':>10}")
+    scenarios = [*old['scenarios'], *(name for name in new['scenarios'] if name not in old['scenarios'])]
+    for name in [*scenarios, 'total']:
+        old_summary = old['total'] if name == 'total' else old['scenarios'].get(name, {})
+        new_summary = new['total'] if name == 'total' else new['scenarios'].get(name, {})
+        for field, higher_is_better in SCENARIO_FIELDS.items():
+            if field not in old_summary or field not in new_summary:
+                continue
+            delta = change(old_summary[field], new_summary[field])
+            print(f"{name:<15}{field:<12}{old_summary[field]:>10.2f}{new_summary[field]:>10.2f}"
+                  f"{'' if delta is None else f'{delta:+.1f}%':>10}")
+            worse = delta is not None and (-delta if higher_is_better else delta)
+            if threshold is not None and worse and worse > threshold:
+                regressions.append(f'{name} {field} {delta:+.1f}%')
+
+    print('time in dependencies, ms per HTTP request:')
+    for name, dep in new['dependencies'].items():
+        if name == 'http' or name not in old['dependencies']:
+            continue
+        old_ms, new_ms = old['dependencies'][name]['per_request_ms'], dep['per_request_ms']
+        delta = change(old_ms, new_ms)
+        print(f"  {name:<13}{old_ms:>10.2f}{new_ms:>10.2f}{'' if delta is None else f'{delta:+.1f}%':>10}")
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('old', type=Path)
+    parser.add_argument('new', type=Path)
+    parser.add_argument('--threshold', type=float, help='допустимое ухудшение, проценты')
+    args = parser.parse_args()
+
+    regressions = compare(orjson.loads(args.old.read_bytes()), orjson.loads(args.new.read_bytes()), args.threshold)
+    if regressions:
+        print('regressions: ' + ', '.join(regressions))
+        sys.exit(1)
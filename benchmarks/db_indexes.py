@@ -0,0 +1,109 @@
+"""
+Планы и время запросов по users.email/username, playlists.user и songs.playlist
+до и после индексов из миграции 7b3e9a1c4d20.
+
+Данные генерируются в отдельной схеме bench_indexes (копии таблиц без индексов),
+рабочие таблицы не трогаются; схема удаляется в конце.
+
+Запуск из корня проекта (нужен Postgres из .env):
+    python -m benchmarks.db_indexes --songs 1000000
+"""
+import argparse
+import asyncio
+import time
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from database import DATABASE_URL
+
+SCHEMA = 'bench_indexes'
+
+QUERIES = {
+    'user by email (get_current_user, login)':
+        "SELECT * FROM users WHERE email = 'user' || :n || '@example.com' AND is_active",
+    'user by username (create_user)':
+        "SELECT * FROM users WHERE username = 'user' || :n",
+    'playlists of user (GET /playlists)':
+        'SELECT * FROM playlists WHERE "user" = :n',
+    'songs of playlist (GET /playlists/{id})':
+        'SELECT * FROM songs WHERE playlist = :n',
+}
+
+INDEXES = [
+    'ALTER TABLE users ADD CONSTRAINT uq_users_email UNIQUE (email)',
+    'ALTER TABLE users ADD CONSTRAINT uq_users_username UNIQUE (username)',
+    'CREATE INDEX ix_playlists_user ON playlists ("user")',
+    'CREATE INDEX ix_songs_playlist ON songs (playlist)',
+]
+
+
+async def seed(conn, users: int, playlists: int, songs: int) -> None:
+    await conn.execute(text(f'DROP SCHEMA IF EXISTS {SCHEMA} CASCADE'))
+    await conn.execute(text(f'CREATE SCHEMA {SCHEMA}'))
+    await conn.execute(text(f'SET search_path TO {SCHEMA}'))
+    for table in ('users', 'playlists', 'songs'):
+        # только колонки и значения по умолчанию, без индексов и ограничений
+        await conn.execute(text(f'CREATE TABLE {table} (LIKE public.{table} INCLUDING DEFAULTS)'))
+
+    await conn.execute(text(
+        "INSERT INTO users (id, username, password, email, is_active) "
+        "SELECT n, 'user' || n, 'hash', 'user' || n || '@example.com', true "
+        "FROM generate_series(1, :users) n"), {'users': users})
+    await conn.execute(text(
+        "INSERT INTO playlists (id, name, \"user\") "
+        "SELECT n, 'playlist ' || n, 1 + (n % :users) FROM generate_series(1, :playlists) n"),
+        {'users': users, 'playlists': playlists})
+    await conn.execute(text(
+        "INSERT INTO songs (id, name, author, duration_text, duration, url, playlist) "
+        "SELECT n, 'song ' || n, 'author ' || (n % 5000), '03:00', 180, "
+        "'https://example.com/' || n, 1 + (n % :playlists) FROM generate_series(1, :songs) n"),
+        {'playlists': playlists, 'songs': songs})
+    await conn.execute(text('ANALYZE users, playlists, songs'))
+
+
+async def measure(conn, n: int, rounds: int) -> dict[str, tuple[str, float]]:
+    result = {}
+    for name, query in QUERIES.items():
+        plan = (await conn.execute(text(f'EXPLAIN (ANALYZE, COSTS OFF) {query}'), {'n': n})).scalars().all()
+        start = time.perf_counter()
+        for i in range(rounds):
+            (await conn.execute(text(query), {'n': n + i})).all()
+        result[name] = ('\n      '.join(plan), (time.perf_counter() - start) / rounds * 1000)
+    return result
+
+
+def report(title: str, result: dict[str, tuple[str, float]]) -> None:
+    print(f'\n=== {title} ===')
+    for name, (plan, ms) in result.items():
+        print(f'{name}: {ms:.3f} ms\n      {plan}')
+
+
+async def main(users: int, playlists: int, songs: int, rounds: int) -> None:
+    engine = create_async_engine(DATABASE_URL)
+    try:
+        async with engine.begin() as conn:
+            start = time.perf_counter()
+            await seed(conn, users, playlists, songs)
+            print(f'seeded users={users} playlists={playlists} songs={songs} '
+                  f'in {time.perf_counter() - start:.1f}s')
+
+            report('without indexes', await measure(conn, users // 2, rounds))
+            for ddl in INDEXES:
+                await conn.execute(text(ddl))
+            await conn.execute(text('ANALYZE users, playlists, songs'))
+            report('with indexes', await measure(conn, users // 2, rounds))
+
+            await conn.execute(text(f'DROP SCHEMA {SCHEMA} CASCADE'))
+    finally:
+        await engine.dispose()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=100_000)
+    parser.add_argument('--playlists', type=int, default=200_000)
+    parser.add_argument('--songs', type=int, default=1_000_000)
+    parser.add_argument('--rounds', type=int, default=50)
+    args = parser.parse_args()
+    asyncio.run(main(args.users, args.playlists, args.songs, args.rounds))
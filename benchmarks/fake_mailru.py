@@ -0,0 +1,67 @@
+"""
+Фейковый поиск mail.ru (GET /cgi-bin/my/ajax) с настраиваемой задержкой и долей ошибок.
+Отвечает в формате, который разбирает utils.mail_ru_search. Используется нагрузочным
+тестом (benchmarks.load_test), можно запустить и отдельно, указав приложению
+MAILRU_SEARCH_URL=http://127.0.0.1:8081/cgi-bin/my/ajax.
+
+Запуск из корня проекта:
+    python -m benchmarks.fake_mailru --port 8081 --latency 0.15 --jitter 0.05 --error-rate 0.01
+"""
+import argparse
+import asyncio
+import random
+
+import orjson
+import uvicorn
+from fastapi import FastAPI, Request, Response
+
+
+def make_track(query: str, i: int) -> dict:
+    duration = 150 + i % 150
+    return {
+        'Name_Text_HTML': f'{query} {i}',
+        'Author': f'Artist {i % 37}',
+        'Album': f'Album {i % 11}',
+        'BitRate': 320,
+        'Duration': f'{duration // 60:0>2}:{duration % 60:0>2}',
+        'DurationInSeconds': duration,
+        'AlbumCoverURL': f'https://musicimg.mail.ru/cover/{i}.jpg',
+        'URL': f'//my.mail.ru/music/songs/{abs(hash((query, i)))}',
+    }
+
+
+def make_fake_mailru(latency: float = 0.15, jitter: float = 0.05, error_rate: float = 0.0) -> FastAPI:
+    """
+    latency и jitter - средняя задержка ответа и её разброс (равномерный), секунды;
+    error_rate - доля ответов 503.
+    """
+    app = FastAPI()
+    app.state.requests = 0
+    app.state.errors = 0
+
+    @app.get('/cgi-bin/my/ajax')
+    async def search(request: Request):
+        app.state.requests += 1
+        await asyncio.sleep(max(0.0, random.uniform(latency - jitter, latency + jitter)))
+        if random.random() < error_rate:
+            app.state.errors += 1
+            return Response(status_code=503)
+
+        query = request.query_params.get('arg_query', '')
+        limit = orjson.loads(request.query_params.get('arg_search_params', '{}')).get('music', {}).get('limit', 100)
+        tracks = [make_track(query, i) for i in range(limit)]
+        # mail.ru отдаёт массив, результаты поиска - в четвёртом элементе
+        return Response(content=orjson.dumps(['AjaxResponse', 'OK', None, {'MusicData': tracks}]),
+                        media_type='application/json')
+
+    return app
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--latency', type=float, default=0.15)
+    parser.add_argument('--jitter', type=float, default=0.05)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    args = parser.parse_args()
+    uvicorn.run(make_fake_mailru(args.latency, args.jitter, args.error_rate), port=args.port, log_level='warning')
@@ -0,0 +1,382 @@
+"""
+Нагрузочный тест приложения со смешанным сценарием: поиск из кеша и мимо кеша, логин,
+CRUD плейлистов, пакетное добавление песен, список песен. Приложение и фейковый mail.ru
+(benchmarks.fake_mailru) запускаются в этом же процессе под uvicorn; Postgres и Redis -
+настоящие, из .env.
+
+Для каждого сценария считаются пропускная способность и p50/p95/p99, а по приросту
+метрик /metrics за прогон - время в зависимостях (upstream, SQL, ожидание пула базы)
+и счётчики кеша. Результат сохраняется в JSON (benchmarks/results/<git sha>-<время>.json),
+два прогона сравнивает benchmarks.compare.
+
+Клиент и сервер делят один процесс и event loop, поэтому абсолютные числа занижены - тест
+предназначен для сравнения коммитов между собой на одной машине. С --url нагрузка подаётся
+на уже запущенное приложение; ему нужно указать MAILRU_SEARCH_URL фейкового сервера
+(http://127.0.0.1:<--upstream-port>/cgi-bin/my/ajax), а если у него задан METRICS_TOKEN -
+передать тот же токен через --metrics-token.
+
+Запуск из корня проекта (Postgres и Redis из .env, миграции применены):
+    python -m benchmarks.load_test --duration 60 --users 20
+    python -m benchmarks.load_test --mix search_hit=80,search_miss=20 --upstream-latency 0.3
+"""
+import argparse
+import asyncio
+import os
+import random
+import socket
+import statistics
+import subprocess
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timezone
+from pathlib import Path
+
+import httpx
+import orjson
+import uvicorn
+from prometheus_client.parser import text_string_to_metric_families
+
+from benchmarks.fake_mailru import make_fake_mailru
+
+RESULTS_DIR = Path(__file__).parent / 'results'
+
+DEFAULT_MIX = 'search_hit=50,search_miss=10,login=5,playlist_crud=20,bulk_songs=5,list_songs=10'
+HOT_QUERIES = [f'hot query {i}' for i in range(20)]
+PASSWORD = 'load-test-password'
+
+SONG = {
+    'name': 'Load test song',
+    'author': 'Rammstein',
+    'album': 'Mutter',
+    'bitrate': 320,
+    'duration_text': '04:32',
+    'duration': 272,
+    'album_cover_url': 'https://musicimg.mail.ru/cover/1.jpg',
+    'url': 'https://my.mail.ru/music/songs/1',
+}
+
+
+class ScenarioError(Exception):
+    pass
+
+
+def check(resp: httpx.Response) -> httpx.Response:
+    if resp.status_code >= 400:
+        raise ScenarioError(f'{resp.request.method} {resp.request.url.path} -> {resp.status_code}')
+    return resp
+
+
+class VirtualUser:
+    def __init__(self, client: httpx.AsyncClient, email: str):
+        self.client = client
+        self.email = email
+        self.playlist_id: int | None = None
+
+
+# Сценарии: одна операция пользователя, может состоять из нескольких запросов
+
+async def search_hit(user: VirtualUser, args) -> None:
+    check(await user.client.get('/search', params={'q': random.choice(HOT_QUERIES)}))
+
+
+async def search_miss(user: VirtualUser, args) -> None:
+    check(await user.client.get('/search', params={'q': f'miss {uuid.uuid4().hex}'}))
+
+
+async def login(user: VirtualUser, args) -> None:
+    check(await user.client.post('/users/login', data={'username': user.email, 'password': PASSWORD}))
+
+
+async def playlist_crud(user: VirtualUser, args) -> None:
+    playlist = check(await user.client.post('/playlists', json={'name': 'crud'})).json()
+    check(await user.client.patch(f"/playlists/{playlist['id']}", params={'name': 'crud renamed'}))
+    check(await user.client.get(f"/playlists/{playlist['id']}"))
+    check(await user.client.delete(f"/playlists/{playlist['id']}"))
+
+
+async def bulk_songs(user: VirtualUser, args) -> None:
+    songs = [SONG] * args.bulk_size
+    check(await user.client.post('/songs/bulk', json={'playlist_id': user.playlist_id, 'songs': songs}))
+
+
+async def list_songs(user: VirtualUser, args) -> None:
+    check(await user.client.get('/songs', params={'limit': 100}))
+
+
+SCENARIOS = {
+    'search_hit': search_hit,
+    'search_miss': search_miss,
+    'login': login,
+    'playlist_crud': playlist_crud,
+    'bulk_songs': bulk_songs,
+    'list_songs': list_songs,
+}
+
+
+def parse_mix(spec: str) -> dict[str, float]:
+    mix = {}
+    for item in filter(None, (part.strip() for part in spec.split(','))):
+        name, _, weight = item.partition('=')
+        if name not in SCENARIOS:
+            raise SystemExit(f'unknown scenario {name!r}, expected one of {", ".join(SCENARIOS)}')
+        mix[name] = float(weight)
+    return mix
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def git_revision() -> tuple[str, bool]:
+    try:
+        sha = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'],
+                             capture_output=True, text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'],
+                                    capture_output=True, text=True, check=True).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown', False
+    return sha, dirty
+
+
+def load_app(upstream_url: str):
+    # config читается при импорте main, поэтому окружение выставляется до него;
+    # load_dotenv не перезаписывает уже заданные переменные
+    os.environ.update({
+        'MAILRU_SEARCH_URL': upstream_url,
+        # лимитер не должен отклонять нагрузку, а логи - её тормозить
+        'THROTTLING_LIMIT': '1000000000',
+        'THROTTLING_RULES': '',
+        'THROTTLING_LOCAL_PRECHECK': 'False',
+        'LOG_LEVEL': 'WARNING',
+        'LOG_FILE': '',
+        'PROFILING_ENABLED': 'False',
+        # /metrics читает сам тест
+        'METRICS_TOKEN': '',
+    })
+    # один процесс - метрики из обычного реестра
+    os.environ.pop('PROMETHEUS_MULTIPROC_DIR', None)
+    import main
+    return main.app
+
+
+async def serve(app, port: int) -> tuple[uvicorn.Server, asyncio.Task]:
+    server = uvicorn.Server(uvicorn.Config(app, host='127.0.0.1', port=port, log_level='warning'))
+    task = asyncio.create_task(server.serve())
+    while not server.started:
+        if task.done():
+            task.result()
+        await asyncio.sleep(0.05)
+    return server, task
+
+
+async def scrape_metrics(client: httpx.AsyncClient) -> dict[tuple, float]:
+    resp = await client.get('/metrics')
+    resp.raise_for_status()
+    values = {}
+    for family in text_string_to_metric_families(resp.text):
+        for sample in family.samples:
+            values[(sample.name, tuple(sorted(sample.labels.items())))] = sample.value
+    return values
+
+
+def metric_delta(before: dict, after: dict, name: str, **labels) -> float:
+    """Прирост суммы всех рядов метрики name (с заданными значениями меток) за прогон."""
+    total = 0.0
+    for (sample_name, sample_labels), value in after.items():
+        if sample_name != name or any(dict(sample_labels).get(k) != v for k, v in labels.items()):
+            continue
+        total += value - before.get((sample_name, sample_labels), 0.0)
+    return total
+
+
+def dependency_report(before: dict, after: dict) -> dict:
+    http_time = metric_delta(before, after, 'http_request_duration_seconds_sum')
+    http_count = metric_delta(before, after, 'http_request_duration_seconds_count')
+    report = {'http': {'seconds': http_time, 'count': http_count}}
+    for name, metric in (('upstream', 'upstream_request_duration_seconds'),
+                         ('db', 'db_statement_duration_seconds'),
+                         ('db_pool_wait', 'db_pool_checkout_wait_seconds')):
+        seconds = metric_delta(before, after, f'{metric}_sum')
+        report[name] = {
+            'seconds': seconds,
+            'count': metric_delta(before, after, f'{metric}_count'),
+            # доля суммарного времени обработки запросов
+            'share_of_http': seconds / http_time if http_time else 0.0,
+            'per_request_ms': seconds / http_count * 1000 if http_count else 0.0,
+        }
+    report['upstream']['errors'] = metric_delta(before, after, 'upstream_errors_total')
+    return report
+
+
+def cache_report(before: dict, after: dict) -> dict:
+    results = ('local_hit', 'hit', 'stale', 'miss', 'stale_if_error')
+    return {result: metric_delta(before, after, 'search_cache_requests_total', result=result) for result in results}
+
+
+def summarize(latencies: list[float], errors: int, elapsed: float) -> dict:
+    summary = {
+        'count': len(latencies),
+        'errors': errors,
+        'throughput': len(latencies) / elapsed,
+    }
+    if len(latencies) >= 2:
+        q = statistics.quantiles(latencies, n=100)
+        summary.update(mean_ms=statistics.fmean(latencies) * 1000,
+                       p50_ms=q[49] * 1000, p95_ms=q[94] * 1000, p99_ms=q[98] * 1000)
+    return summary
+
+
+async def create_user(base_url: str, run_id: str, i: int) -> VirtualUser:
+    client = httpx.AsyncClient(base_url=base_url, timeout=30)
+    email = f'loadtest_{run_id}_{i}@example.com'
+    check(await client.post('/users', json={'username': f'lt_{run_id}_{i}', 'email': email, 'password': PASSWORD}))
+    user = VirtualUser(client, email)
+    await login(user, None)
+    user.playlist_id = check(await client.post('/playlists', json={'name': 'load test'})).json()['id']
+    return user
+
+
+async def drive(user: VirtualUser, args, mix: dict[str, float], deadline: float,
+                latencies: dict[str, list[float]], errors: Counter, error_samples: Counter) -> None:
+    names, weights = list(mix), list(mix.values())
+    while time.perf_counter() < deadline:
+        name = random.choices(names, weights)[0]
+        start = time.perf_counter()
+        try:
+            await SCENARIOS[name](user, args)
+        except (ScenarioError, httpx.HTTPError) as e:
+            errors[name] += 1
+            error_samples[f'{name}: {e}'] += 1
+            continue
+        latencies[name].append(time.perf_counter() - start)
+
+
+async def delete_users(run_id: str) -> None:
+    from sqlalchemy import delete
+    from app.models.models import User as UserModel
+    from database import async_session_maker
+
+    # плейлисты и песни удаляются каскадно
+    async with async_session_maker() as db:
+        await db.execute(delete(UserModel).where(UserModel.email.like(f'loadtest_{run_id}_%')))
+        await db.commit()
+
+
+async def run(args) -> dict:
+    mix = parse_mix(args.mix)
+    run_id = uuid.uuid4().hex[:8]
+
+    upstream = make_fake_mailru(args.upstream_latency, args.upstream_jitter, args.upstream_error_rate)
+    upstream_port = args.upstream_port or free_port()
+    upstream_server, upstream_task = await serve(upstream, upstream_port)
+    upstream_url = f'http://127.0.0.1:{upstream_port}/cgi-bin/my/ajax'
+
+    app_server = app_task = None
+    base_url = args.url
+    if base_url is None:
+        app_port = free_port()
+        app_server, app_task = await serve(load_app(upstream_url), app_port)
+        base_url = f'http://127.0.0.1:{app_port}'
+    print(f'app: {base_url}  fake mail.ru: {upstream_url}')
+
+    users: list[VirtualUser] = []
+    try:
+        # регистрация упирается в bcrypt - не больше четырёх одновременно
+        semaphore = asyncio.Semaphore(4)
+
+        async def create(i: int) -> VirtualUser:
+            async with semaphore:
+                return await create_user(base_url, run_id, i)
+
+        users = await asyncio.gather(*(create(i) for i in range(args.users)))
+        # горячие запросы попадают в кеш до начала замера
+        for query in HOT_QUERIES:
+            check(await users[0].client.get('/search', params={'q': query}))
+
+        metrics_headers = {'Authorization': f'Bearer {args.metrics_token}'} if args.metrics_token else None
+        async with httpx.AsyncClient(base_url=base_url, timeout=30, headers=metrics_headers) as metrics_client:
+            before = await scrape_metrics(metrics_client)
+            upstream_requests = upstream.state.requests
+            latencies: dict[str, list[float]] = {name: [] for name in mix}
+            errors, error_samples = Counter(), Counter()
+            start = time.perf_counter()
+            await asyncio.gather(*(drive(user, args, mix, start + args.duration, latencies, errors, error_samples)
+                                   for user in users))
+            elapsed = time.perf_counter() - start
+            after = await scrape_metrics(metrics_client)
+    finally:
+        for user in users:
+            await user.client.aclose()
+        await delete_users(run_id)
+        if app_server is not None:
+            app_server.should_exit = True
+            await app_task
+        upstream_server.should_exit = True
+        await upstream_task
+
+    sha, dirty = git_revision()
+    all_latencies = [latency for values in latencies.values() for latency in values]
+    return {
+        'git_sha': sha,
+        'git_dirty': dirty,
+        'started_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'params': {
+            'duration': args.duration,
+            'users': args.users,
+            'mix': mix,
+            'bulk_size': args.bulk_size,
+            'hot_queries': len(HOT_QUERIES),
+            'upstream': {'latency': args.upstream_latency, 'jitter': args.upstream_jitter,
+                         'error_rate': args.upstream_error_rate},
+            'external_app': args.url is not None,
+        },
+        'total': summarize(all_latencies, sum(errors.values()), elapsed),
+        'scenarios': {name: summarize(latencies[name], errors[name], elapsed) for name in mix},
+        'dependencies': dependency_report(before, after),
+        'cache': cache_report(before, after),
+        'upstream_requests': upstream.state.requests - upstream_requests,
+        'rate_limit_rejections': metric_delta(before, after, 'rate_limit_rejections_total'),
+        'error_samples': dict(error_samples.most_common(10)),
+    }
+
+
+def print_report(result: dict) -> None:
+    print(f"commit {result['git_sha']}{' (dirty)' if result['git_dirty'] else ''}")
+    print(f"{'scenario':<15}{'ops/s':>10}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name, summary in [*result['scenarios'].items(), ('total', result['total'])]:
+        print(f"{name:<15}{summary['throughput']:>10.1f}{summary['errors']:>8}"
+              f"{summary.get('p50_ms', 0):>10.2f}{summary.get('p95_ms', 0):>10.2f}{summary.get('p99_ms', 0):>10.2f}")
+    print('time in dependencies (per HTTP request):')
+    for name, dep in result['dependencies'].items():
+        if name != 'http':
+            print(f"  {name:<13}{dep['per_request_ms']:>8.2f} ms  {dep['share_of_http'] * 100:>5.1f}% of request time")
+    print(f"cache: {result['cache']}  upstream requests: {result['upstream_requests']}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--duration', type=float, default=30, help='длительность замера, секунды')
+    parser.add_argument('--users', type=int, default=20, help='одновременных виртуальных пользователей')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help='веса сценариев: имя=вес,...')
+    parser.add_argument('--bulk-size', type=int, default=100, help='песен в одном POST /songs/bulk')
+    parser.add_argument('--upstream-latency', type=float, default=0.15)
+    parser.add_argument('--upstream-jitter', type=float, default=0.05)
+    parser.add_argument('--upstream-error-rate', type=float, default=0.0)
+    parser.add_argument('--upstream-port', type=int, default=0, help='порт фейкового mail.ru (0 - любой свободный)')
+    parser.add_argument('--url', help='нагружать уже запущенное приложение вместо запуска в процессе')
+    parser.add_argument('--metrics-token', help='METRICS_TOKEN приложения из --url для чтения /metrics')
+    parser.add_argument('--out', type=Path, help='файл результата (по умолчанию benchmarks/results/<sha>-<время>.json)')
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args))
+    print_report(result)
+    out = args.out
+    if out is None:
+        suffix = '-dirty' if result['git_dirty'] else ''
+        out = RESULTS_DIR / f"{result['git_sha']}{suffix}-{datetime.now():%Y%m%d-%H%M%S}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_bytes(orjson.dumps(result, option=orjson.OPT_INDENT_2))
+    print(f'saved {out}')
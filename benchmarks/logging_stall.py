@@ -0,0 +1,84 @@
+"""
+Бенчмарк задержек event loop из-за логирования. Пока нагрузка пишет записи (как logger.debug
+в /search), отдельная задача каждую миллисекунду засыпает и меряет, на сколько позже
+положенного проснулась, - это и есть время, на которое логирование блокирует event loop.
+
+Режимы: логирование выключено, синхронная запись в файл (как было в main.py), очередь
+loguru (enqueue=True) и фоновый поток logging_config.BackgroundSink (как в setup_logging).
+
+Запуск из корня проекта:
+    python -m benchmarks.logging_stall --records 20000
+"""
+import argparse
+import asyncio
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+from loguru import logger
+
+from logging_config import create_sink
+
+TICK = 0.001
+
+
+async def ticker(stop: asyncio.Event, lags: list[float]) -> None:
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        expected = loop.time() + TICK
+        await asyncio.sleep(TICK)
+        lags.append(max(loop.time() - expected, 0.0))
+
+
+async def workload(records: int, batch: int) -> None:
+    for i in range(0, records, batch):
+        for j in range(i, min(i + batch, records)):
+            logger.debug("query={}; mail.ru={}; vk={};", f"query number {j}", True, False)
+        # как обработчики между записями отдают управление event loop
+        await asyncio.sleep(0)
+
+
+async def measure(records: int, batch: int) -> tuple[float, list[float]]:
+    stop = asyncio.Event()
+    lags: list[float] = []
+    tick_task = asyncio.create_task(ticker(stop, lags))
+    start = time.perf_counter()
+    await workload(records, batch)
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await tick_task
+    await logger.complete()
+    return elapsed, lags
+
+
+def report(name: str, elapsed: float, lags: list[float]) -> None:
+    q = statistics.quantiles(lags, n=100, method='inclusive') if len(lags) > 1 else [0.0] * 99
+    print(f'{name:<16} logging {elapsed * 1000:8.1f} ms   loop lag p50={q[49] * 1000:6.3f} ms  '
+          f'p99={q[98] * 1000:6.3f} ms  max={max(lags, default=0) * 1000:7.3f} ms')
+
+
+async def run(records: int, batch: int, serialize: bool) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        modes = ['off', 'sync file', 'enqueue', 'background']
+        print(f'records={records} batch={batch} serialize={serialize}')
+        for name in modes:
+            logger.remove()
+            path = Path(tmp) / f'{name.replace(" ", "_")}.log'
+            if name == 'background':
+                logger.add(create_sink(serialize, (path, dict(rotation='10mb'))), level='DEBUG',
+                           format=lambda record: '')
+            elif name != 'off':
+                logger.add(path, level='DEBUG', serialize=serialize, rotation='10mb', enqueue=name == 'enqueue')
+            elapsed, lags = await measure(records, batch)
+            report(name, elapsed, lags)
+        logger.remove()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--records', type=int, default=20000)
+    parser.add_argument('--batch', type=int, default=20, help='записей между передачами управления event loop')
+    parser.add_argument('--text', action='store_true', help='текстовый формат вместо JSON')
+    args = parser.parse_args()
+    asyncio.run(run(args.records, args.batch, not args.text))
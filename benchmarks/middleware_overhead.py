@@ -0,0 +1,103 @@
+"""
+Микро-бенчмарк накладных расходов ThrottlingMiddleware: прежняя реализация на
+BaseHTTPMiddleware против чистого ASGI. Redis заменён лимитером в памяти, который всегда
+пропускает запрос, - измеряется только сам стек middleware. Приложение вызывается
+напрямую через ASGI, без HTTP-клиента.
+
+Запуск из корня проекта:
+    python -m benchmarks.middleware_overhead --requests 20000
+"""
+import argparse
+import asyncio
+import time
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+from starlette.middleware.base import BaseHTTPMiddleware
+
+from middlewares import ThrottlingMiddleware
+from rate_limit import RateLimitResult, client_identity
+
+
+class AllowAllLimiter:
+    async def hit(self, identity: str, path: str, probe_key: str | None = None) -> RateLimitResult:
+        return RateLimitResult(True, 60, 59, 0, 1)
+
+
+class BaseHTTPThrottlingMiddleware(BaseHTTPMiddleware):
+    # так ThrottlingMiddleware был устроен до перехода на чистый ASGI
+    def __init__(self, app, limiter):
+        super().__init__(app)
+        self.limiter = limiter
+
+    async def dispatch(self, request: Request, call_next):
+        result = await self.limiter.hit(client_identity(request, 0), request.url.path)
+        if not result.allowed:
+            return JSONResponse(status_code=429, content={"detail": "Too many requests"})
+        response = await call_next(request)
+        response.headers.update(result.headers())
+        return response
+
+
+def make_app(middleware) -> FastAPI:
+    app = FastAPI()
+
+    @app.get('/ping')
+    async def ping():
+        return {'status': 'ok'}
+
+    if middleware is not None:
+        app.add_middleware(middleware, limiter=AllowAllLimiter())
+    return app
+
+
+async def measure(app, requests: int) -> float:
+    scope = {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': 'GET',
+        'scheme': 'http',
+        'path': '/ping',
+        'raw_path': b'/ping',
+        'query_string': b'',
+        'root_path': '',
+        'headers': [(b'host', b'bench')],
+        'client': ('127.0.0.1', 12345),
+        'server': ('bench', 80),
+    }
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        pass
+
+    async def one():
+        await app({**scope}, receive, send)
+
+    # прогрев (в том числе сборка стека middleware при первом вызове)
+    for _ in range(200):
+        await one()
+    start = time.perf_counter()
+    for _ in range(requests):
+        await one()
+    return requests / (time.perf_counter() - start)
+
+
+async def main(requests: int) -> None:
+    bare = await measure(make_app(None), requests)
+    before = await measure(make_app(BaseHTTPThrottlingMiddleware), requests)
+    after = await measure(make_app(ThrottlingMiddleware), requests)
+    print(f'requests={requests}')
+    print(f'no middleware:        {bare:10.1f} req/s')
+    print(f'BaseHTTPMiddleware:   {before:10.1f} req/s')
+    print(f'pure ASGI:            {after:10.1f} req/s')
+    print(f'speedup: x{after / before:.2f}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, default=20000)
+    args = parser.parse_args()
+    asyncio.run(main(args.requests))
@@ -0,0 +1,82 @@
+"""
+Прогоняет запросы из логов /search через модель кеша и сравнивает hit rate
+для сырых ключей и ключей после normalize_query.
+
+Запуск из корня проекта:
+    python -m benchmarks.query_normalization_report logs/main.log --ttl 600
+"""
+import argparse
+import re
+from datetime import datetime
+
+import orjson
+
+from utils import normalize_query
+
+
+# строка, которую пишет main.search через loguru
+LOG_LINE = re.compile(
+    r'^(?P<ts>\d{4}-\d\d-\d\d \d\d:\d\d:\d\d\.\d+) \|.*? - query=(?P<q>.*); mail\.ru=(?P<mailru>\w+);(?: vk=(?P<vk>\w+);)?$'
+)
+# её сообщение в JSON-логах (LOG_JSON=True)
+LOG_MESSAGE = re.compile(r'^query=(?P<q>.*); mail\.ru=(?P<mailru>\w+);(?: vk=(?P<vk>\w+);)?$')
+
+
+def parse_line(line: str) -> tuple[float, re.Match] | None:
+    if line.startswith('{'):
+        try:
+            record = orjson.loads(line)
+        except orjson.JSONDecodeError:
+            return None
+        m = LOG_MESSAGE.match(record.get('message', ''))
+        return (datetime.fromisoformat(record['time']).timestamp(), m) if m else None
+    m = LOG_LINE.match(line)
+    return (datetime.strptime(m['ts'], '%Y-%m-%d %H:%M:%S.%f').timestamp(), m) if m else None
+
+
+def read_queries(paths: list[str]) -> list[tuple[float, str, str]]:
+    """Возвращает (время, запрос, набор провайдеров) в хронологическом порядке."""
+    queries = []
+    for path in paths:
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                parsed = parse_line(line.rstrip('\n'))
+                if parsed:
+                    ts, m = parsed
+                    queries.append((ts, m['q'], f"{m['mailru']}:{m['vk'] or 'False'}"))
+    queries.sort(key=lambda x: x[0])
+    return queries
+
+
+def replay(queries: list[tuple[float, str, str]], make_key, ttl: float) -> tuple[float, int]:
+    """Возвращает (hit rate, число уникальных ключей) для кеша с TTL."""
+    expires: dict[tuple[str, str], float] = {}
+    hits = 0
+    for ts, q, providers in queries:
+        key = (make_key(q), providers)
+        if expires.get(key, 0) > ts:
+            hits += 1
+        else:
+            expires[key] = ts + ttl
+    return hits / len(queries), len(expires)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('logs', nargs='+', help='файлы логов (logs/main.log*)')
+    parser.add_argument('--ttl', type=float, default=600, help='время жизни записи кеша, сек')
+    args = parser.parse_args()
+
+    queries = read_queries(args.logs)
+    if not queries:
+        raise SystemExit('no search queries found in logs')
+
+    print(f'queries={len(queries)} ttl={args.ttl:g}s')
+    print(f'{"key":<22} {"hit rate":>9} {"keys":>8}')
+    for name, make_key in (
+        ('raw', lambda q: q),
+        ('normalized', normalize_query),
+        ('normalized+translit', lambda q: normalize_query(q, translit=True)),
+    ):
+        hit_rate, keys = replay(queries, make_key, args.ttl)
+        print(f'{name:<22} {hit_rate:>9.2%} {keys:>8}')
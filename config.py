@@ -11,11 +11,132 @@ DB_PORT = os.getenv("DB_PORT")
 DB_HOST = os.getenv("DB_HOST")
 REDIS_HOST = os.getenv("REDIS_HOST")
 REDIS_PORT = os.getenv("REDIS_PORT")
+# пул соединений к Redis на воркер; подписка на инвалидации кеша держит одно соединение постоянно
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", 50))
+# сколько секунд ждать свободное соединение из пула
+REDIS_POOL_TIMEOUT = float(os.getenv("REDIS_POOL_TIMEOUT", 2))
+# соединение, простоявшее дольше, перед использованием проверяется PING
+REDIS_HEALTH_CHECK_INTERVAL = int(os.getenv("REDIS_HEALTH_CHECK_INTERVAL", 30))
 SECRET_KEY = os.getenv("SECRET_KEY")
 ALGORITHM = os.getenv("ALGORITHM")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES"))
 REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS"))
 HOST = os.getenv("HOST")
 CACHE_TTL = int(os.getenv("CACHE_TTL"))
+# после soft TTL значение ещё отдаётся, но обновляется в фоне; после hard TTL удаляется из Redis
+CACHE_SOFT_TTL = int(os.getenv("CACHE_SOFT_TTL", CACHE_TTL))
+CACHE_HARD_TTL = max(int(os.getenv("CACHE_HARD_TTL", CACHE_TTL)), CACHE_SOFT_TTL)
+# сколько секунд неполная выдача (часть провайдеров не ответила) считается свежей
+CACHE_DEGRADED_TTL = min(int(os.getenv("CACHE_DEGRADED_TTL", 30)), CACHE_SOFT_TTL)
 THROTTLING_LIMIT = int(os.getenv("THROTTLING_LIMIT"))
 THROTTLING_LIMIT_TIME = int(os.getenv("THROTTLING_LIMIT_TIME"))
+# отдельные лимиты для путей: "/users/login=5/60;/search=30/10" (префикс=запросов/секунд),
+# для остальных путей - THROTTLING_LIMIT запросов за THROTTLING_LIMIT_TIME секунд
+THROTTLING_RULES = os.getenv("THROTTLING_RULES", "")
+# сколько прокси перед приложением дописывают X-Forwarded-For (0 - заголовку не доверяем)
+THROTTLING_TRUSTED_HOPS = int(os.getenv("THROTTLING_TRUSTED_HOPS", 0))
+# отклонять флуд по счётчикам воркера, не обращаясь к Redis. Воркер видит примерно 1/N запросов
+# клиента (N - число воркеров gunicorn), так что проверка срабатывает, только когда клиент
+# превышает лимит примерно в N раз; по умолчанию выключена
+THROTTLING_LOCAL_PRECHECK = os.getenv("THROTTLING_LOCAL_PRECHECK", "False").lower() in ("1", "true", "yes")
+
+# single-flight для промахов кеша поиска
+CACHE_LOCK_TTL = int(os.getenv("CACHE_LOCK_TTL", 15))
+CACHE_LOCK_WAIT = float(os.getenv("CACHE_LOCK_WAIT", 10))
+
+# L1-кеш ответов поиска в памяти каждого воркера
+L1_CACHE_MAX_ENTRIES = int(os.getenv("L1_CACHE_MAX_ENTRIES", 500))
+L1_CACHE_MAX_BYTES = int(os.getenv("L1_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+L1_CACHE_TTL = min(int(os.getenv("L1_CACHE_TTL", 10)), CACHE_SOFT_TTL)
+
+# сжатие значений кеша поиска в Redis (0 - не сжимать)
+CACHE_COMPRESS_THRESHOLD = int(os.getenv("CACHE_COMPRESS_THRESHOLD", 1024))
+CACHE_COMPRESS_LEVEL = int(os.getenv("CACHE_COMPRESS_LEVEL", 6))
+
+# с каким лимитом запрашивать mail.ru при промахе: 0 - с запрошенным mcount,
+# 300 - сразу с максимальным, чтобы все меньшие mcount обслуживались из одной записи кеша
+SEARCH_PREFETCH_COUNT = min(int(os.getenv("SEARCH_PREFETCH_COUNT", 0)), 300)
+
+# транслитерировать кириллицу при построении ключа кеша ("Раммштайн" == "rammshtain")
+SEARCH_TRANSLIT_FOLD = os.getenv("SEARCH_TRANSLIT_FOLD", "False").lower() in ("1", "true", "yes")
+
+# клиент mail.ru: пул соединений и таймауты (сек)
+UPSTREAM_MAX_CONNECTIONS = int(os.getenv("UPSTREAM_MAX_CONNECTIONS", 100))
+UPSTREAM_MAX_KEEPALIVE = int(os.getenv("UPSTREAM_MAX_KEEPALIVE", 20))
+UPSTREAM_KEEPALIVE_EXPIRY = float(os.getenv("UPSTREAM_KEEPALIVE_EXPIRY", 30))
+UPSTREAM_CONNECT_TIMEOUT = float(os.getenv("UPSTREAM_CONNECT_TIMEOUT", 3))
+UPSTREAM_READ_TIMEOUT = float(os.getenv("UPSTREAM_READ_TIMEOUT", 10))
+UPSTREAM_WRITE_TIMEOUT = float(os.getenv("UPSTREAM_WRITE_TIMEOUT", 5))
+UPSTREAM_POOL_TIMEOUT = float(os.getenv("UPSTREAM_POOL_TIMEOUT", 2))
+UPSTREAM_HTTP2 = os.getenv("UPSTREAM_HTTP2", "False").lower() in ("1", "true", "yes")
+
+# circuit breaker, повторы и хеджирование запросов к mail.ru
+BREAKER_WINDOW = float(os.getenv("BREAKER_WINDOW", 30))
+BREAKER_MIN_REQUESTS = int(os.getenv("BREAKER_MIN_REQUESTS", 20))
+BREAKER_ERROR_RATE = float(os.getenv("BREAKER_ERROR_RATE", 0.5))
+BREAKER_SLOW_CALL = float(os.getenv("BREAKER_SLOW_CALL", 3))
+BREAKER_SLOW_CALL_RATE = float(os.getenv("BREAKER_SLOW_CALL_RATE", 0.5))
+BREAKER_OPEN_SECONDS = int(os.getenv("BREAKER_OPEN_SECONDS", 15))
+UPSTREAM_RETRY_RATIO = float(os.getenv("UPSTREAM_RETRY_RATIO", 0.1))
+UPSTREAM_MAX_RETRIES = int(os.getenv("UPSTREAM_MAX_RETRIES", 1))
+UPSTREAM_HEDGE = os.getenv("UPSTREAM_HEDGE", "False").lower() in ("1", "true", "yes")
+
+# федеративный поиск: сколько ждём каждого провайдера (сек) и потоки для синхронного VK SDK
+MAILRU_DEADLINE = float(os.getenv("MAILRU_DEADLINE", 8))
+# адрес поиска mail.ru; бенчмарки подменяют его фейковым сервером (benchmarks/fake_mailru.py)
+MAILRU_SEARCH_URL = os.getenv("MAILRU_SEARCH_URL", "https://my.mail.ru/cgi-bin/my/ajax")
+VK_DEADLINE = float(os.getenv("VK_DEADLINE", 3))
+VK_THREADS = int(os.getenv("VK_THREADS", 4))
+
+# авторизация по claims JWT без запроса пользователя из базы на каждый запрос
+AUTH_STATELESS = os.getenv("AUTH_STATELESS", "False").lower() in ("1", "true", "yes")
+# как часто воркер перечитывает из Redis список отозванных пользователей (сек)
+AUTH_REVOCATION_REFRESH = float(os.getenv("AUTH_REVOCATION_REFRESH", 5))
+
+# размер страницы списков плейлистов и песен
+PAGE_SIZE_DEFAULT = int(os.getenv("PAGE_SIZE_DEFAULT", 500))
+PAGE_SIZE_MAX = max(int(os.getenv("PAGE_SIZE_MAX", 1000)), PAGE_SIZE_DEFAULT)
+
+# движок SQLAlchemy: логирование SQL, пул соединений (на воркер), кеш подготовленных выражений
+DB_ECHO = os.getenv("DB_ECHO", "False").lower() in ("1", "true", "yes")
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 10))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 10))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 10))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 1800))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "True").lower() in ("1", "true", "yes")
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", 100))
+# statement_timeout на сервере, мс (0 - без ограничения)
+DB_STATEMENT_TIMEOUT = int(os.getenv("DB_STATEMENT_TIMEOUT", 5000))
+
+# пул потоков для bcrypt: число потоков и сколько операций может ждать в очереди (дальше - 503)
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", 2))
+PASSWORD_HASH_QUEUE = int(os.getenv("PASSWORD_HASH_QUEUE", 32))
+
+# /stats и /metrics требуют заголовок Authorization: Bearer <METRICS_TOKEN>; пустой - без проверки
+# (порт приложения наружу не публикуется, nginx эти пути не проксирует)
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
+# профилирование запросов (pyinstrument); при PROFILING_ENABLED=False middleware не подключается
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "False").lower() in ("1", "true", "yes")
+# запрос с заголовком X-Profile-Token: <PROFILING_TOKEN> профилируется всегда; токен нужен и для скачивания
+PROFILING_TOKEN = os.getenv("PROFILING_TOKEN", "")
+# доля случайных запросов, которые профилируются без токена
+PROFILING_SAMPLE_RATE = float(os.getenv("PROFILING_SAMPLE_RATE", 0))
+PROFILING_INTERVAL = float(os.getenv("PROFILING_INTERVAL", 0.001))
+PROFILING_DIR = os.getenv("PROFILING_DIR", "profiles")
+# старые профили удаляются: хранится не больше PROFILING_MAX_FILES файлов не старше PROFILING_MAX_AGE секунд
+# (0 - без ограничения)
+PROFILING_MAX_FILES = int(os.getenv("PROFILING_MAX_FILES", 500))
+PROFILING_MAX_AGE = float(os.getenv("PROFILING_MAX_AGE", 24 * 60 * 60))
+
+# DEBUG=True - подробные логи (LOG_LEVEL по умолчанию DEBUG); в продакшене выключен
+DEBUG = os.getenv("DEBUG", "False").lower() in ("1", "true", "yes")
+LOG_LEVEL = os.getenv("LOG_LEVEL", "DEBUG" if DEBUG else "INFO").upper()
+# записи логов в JSON (для сборщиков логов) вместо текста
+LOG_JSON = os.getenv("LOG_JSON", "False").lower() in ("1", "true", "yes")
+# пустое значение - только stderr
+LOG_FILE = os.getenv("LOG_FILE", "logs/main.log")
+LOG_ROTATION = os.getenv("LOG_ROTATION", "10mb")
+# доля записей уровней DEBUG и INFO, которые пишутся (для горячих путей вроде /search)
+LOG_SAMPLE_DEBUG = float(os.getenv("LOG_SAMPLE_DEBUG", 1))
+LOG_SAMPLE_INFO = float(os.getenv("LOG_SAMPLE_INFO", 1))
@@ -1,18 +1,98 @@
+import time
+
 from config import DB_NAME, DB_USER, DB_PASS, DB_HOST, DB_PORT
+from config import (DB_ECHO, DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE, DB_POOL_PRE_PING,
+                    DB_STATEMENT_CACHE_SIZE, DB_STATEMENT_TIMEOUT)
 
+from sqlalchemy import event
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.orm import DeclarativeBase
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from metrics import DB_STATEMENT_LATENCY, DB_POOL_CHECKOUT_WAIT, DB_POOL_CHECKED_OUT, DB_POOL_OPEN
 
 DATABASE_URL = f"postgresql+asyncpg://{DB_USER}:{DB_PASS}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
 
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    """
+    Пул соединений, который замеряет, сколько запросы ждут свободное соединение.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.checkouts = 0
+        self.checkout_wait_total = 0.0
+        self.checkout_wait_max = 0.0
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            wait = time.perf_counter() - start
+            self.checkouts += 1
+            self.checkout_wait_total += wait
+            self.checkout_wait_max = max(self.checkout_wait_max, wait)
+            DB_POOL_CHECKOUT_WAIT.observe(wait)
+
+
 # Создаём Engine
 # echo=True включает логирование SQL-запросов в консоль, что полезно для отладки, но в продакшене его
-#   лучше отключить для оптимизации.
-async_engine = create_async_engine(DATABASE_URL, echo=True)
+#   лучше отключить для оптимизации (DB_ECHO).
+# Размер пула на воркер: с 4 воркерами gunicorn соединений до 4 * (DB_POOL_SIZE + DB_MAX_OVERFLOW).
+async_engine = create_async_engine(
+    # кеш подготовленных выражений asyncpg-диалекта SQLAlchemy на соединение
+    f"{DATABASE_URL}?prepared_statement_cache_size={DB_STATEMENT_CACHE_SIZE}",
+    echo=DB_ECHO,
+    poolclass=TimedQueuePool,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT,
+    pool_recycle=DB_POOL_RECYCLE,
+    pool_pre_ping=DB_POOL_PRE_PING,
+    # statement_timeout выставляется на стороне сервера для каждого соединения
+    connect_args={"server_settings": {"statement_timeout": str(DB_STATEMENT_TIMEOUT)}},
+)
+
+# Метрики пула и времени выполнения SQL-выражений
+event.listen(async_engine.sync_engine.pool, "connect", lambda *args: DB_POOL_OPEN.inc())
+event.listen(async_engine.sync_engine.pool, "close", lambda *args: DB_POOL_OPEN.dec())
+event.listen(async_engine.sync_engine.pool, "checkout", lambda *args: DB_POOL_CHECKED_OUT.inc())
+event.listen(async_engine.sync_engine.pool, "checkin", lambda *args: DB_POOL_CHECKED_OUT.dec())
+
+
+@event.listens_for(async_engine.sync_engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context._metrics_start = time.perf_counter()
+
+
+@event.listens_for(async_engine.sync_engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # по первому слову (SELECT, INSERT, ...), а не по тексту - иначе число рядов метрики не ограничено
+    operation = statement.split(None, 1)[0].upper() if statement.strip() else "OTHER"
+    DB_STATEMENT_LATENCY.labels(operation).observe(time.perf_counter() - context._metrics_start)
+
 
 # Настраиваем фабрику сеансов
 async_session_maker = async_sessionmaker(async_engine, expire_on_commit=False, class_=AsyncSession)
 
 
+def db_pool_stats() -> dict:
+    """
+    Состояние пула соединений с базой текущего воркера.
+    """
+    pool: TimedQueuePool = async_engine.sync_engine.pool
+    return {
+        "size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "overflow": pool.overflow(),
+        "checked_in": pool.checkedin(),
+        "checkouts": pool.checkouts,
+        "checkout_wait_avg": pool.checkout_wait_total / pool.checkouts if pool.checkouts else 0.0,
+        "checkout_wait_max": pool.checkout_wait_max,
+    }
+
+
 class Base(DeclarativeBase):
     pass
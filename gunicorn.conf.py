@@ -0,0 +1,22 @@
+"""
+Настройки gunicorn, нужные для метрик Prometheus в multiprocess-режиме
+(каталог задаётся переменной PROMETHEUS_MULTIPROC_DIR).
+"""
+import os
+import shutil
+
+from prometheus_client import multiprocess
+
+
+def on_starting(server):
+    # файлы прошлого запуска дали бы устаревшие значения счётчиков
+    path = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+    if path:
+        shutil.rmtree(path, ignore_errors=True)
+        os.makedirs(path, exist_ok=True)
+
+
+def child_exit(server, worker):
+    # livesum/livemax-метрики завершившегося воркера больше не учитываются
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,113 @@
+import httpx
+from fastapi import Request
+
+import config
+
+
+class _ReleasingStream(httpx.AsyncByteStream):
+    """Тело ответа, которое при закрытии сообщает транспорту, что запрос завершён."""
+
+    def __init__(self, stream: httpx.AsyncByteStream, on_close):
+        self._stream = stream
+        self._on_close = on_close
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self) -> None:
+        try:
+            await self._stream.aclose()
+        finally:
+            if self._on_close is not None:
+                self._on_close()
+                self._on_close = None
+
+
+class InstrumentedTransport(httpx.AsyncBaseTransport):
+    """
+    Обёртка над транспортом httpx, считающая запросы в работе (от отправки до закрытия
+    ответа) и отказы пула. У httpx нет публичного API для состояния пула, а внутренности
+    httpcore меняются между версиями.
+    """
+
+    def __init__(self, transport: httpx.AsyncBaseTransport):
+        self._transport = transport
+        self.in_flight = 0
+        self.requests = 0
+        self.errors = 0
+        # не дождались свободного соединения за UPSTREAM_POOL_TIMEOUT
+        self.pool_timeouts = 0
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        self.requests += 1
+        self.in_flight += 1
+        try:
+            response = await self._transport.handle_async_request(request)
+        except BaseException as e:
+            self.in_flight -= 1
+            if isinstance(e, httpx.PoolTimeout):
+                self.pool_timeouts += 1
+            elif isinstance(e, Exception):
+                self.errors += 1
+            raise
+        if response.is_closed:
+            # тело уже прочитано транспортом - закрывать нечего
+            self._release()
+        else:
+            response.stream = _ReleasingStream(response.stream, self._release)
+        return response
+
+    def _release(self) -> None:
+        self.in_flight -= 1
+
+    async def aclose(self) -> None:
+        await self._transport.aclose()
+
+
+def create_upstream_transport() -> InstrumentedTransport:
+    """
+    Транспорт для запросов к mail.ru с настраиваемым пулом соединений.
+    Живёт всё время работы воркера, создаётся и закрывается в lifespan приложения.
+    """
+    limits = httpx.Limits(
+        max_connections=config.UPSTREAM_MAX_CONNECTIONS,
+        max_keepalive_connections=config.UPSTREAM_MAX_KEEPALIVE,
+        keepalive_expiry=config.UPSTREAM_KEEPALIVE_EXPIRY,
+    )
+    return InstrumentedTransport(httpx.AsyncHTTPTransport(limits=limits, http2=config.UPSTREAM_HTTP2))
+
+
+def create_upstream_client(transport: httpx.AsyncBaseTransport) -> httpx.AsyncClient:
+    """
+    Создаёт клиент для запросов к mail.ru поверх transport с раздельными таймаутами.
+    """
+    timeout = httpx.Timeout(
+        connect=config.UPSTREAM_CONNECT_TIMEOUT,
+        read=config.UPSTREAM_READ_TIMEOUT,
+        write=config.UPSTREAM_WRITE_TIMEOUT,
+        pool=config.UPSTREAM_POOL_TIMEOUT,
+    )
+    return httpx.AsyncClient(transport=transport, timeout=timeout)
+
+
+def get_upstream_client(request: Request) -> httpx.AsyncClient:
+    return request.app.state.upstream_client
+
+
+def get_upstream_transport(request: Request) -> InstrumentedTransport:
+    return request.app.state.upstream_transport
+
+
+def upstream_pool_stats(transport: InstrumentedTransport) -> dict:
+    """
+    Загрузка пула соединений к mail.ru: сколько запросов сейчас в работе (занятые соединения
+    и ожидающие в очереди пула) и сколько не дождались соединения.
+    """
+    return {
+        "max_connections": config.UPSTREAM_MAX_CONNECTIONS,
+        "in_flight": transport.in_flight,
+        "requests": transport.requests,
+        "errors": transport.errors,
+        "pool_timeouts": transport.pool_timeouts,
+    }
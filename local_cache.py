@@ -0,0 +1,50 @@
+import time
+from collections import OrderedDict
+
+
+class LocalCache:
+    """
+    LRU-кеш в памяти воркера с TTL и ограничением по числу записей и суммарному размеру.
+    Хранит уже сериализованные ответы (bytes), поэтому размер записи известен точно.
+    """
+
+    def __init__(self, max_entries: int, max_bytes: int, ttl: float):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.size = 0
+        self._data: OrderedDict[str, tuple[float, bytes]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: str) -> bytes | None:
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            self.delete(key)
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: bytes) -> None:
+        if self.max_entries <= 0 or len(value) > self.max_bytes:
+            return
+        self.delete(key)
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self.size += len(value)
+        # вытесняем самые давно использованные записи, пока не уложимся в лимиты
+        while len(self._data) > self.max_entries or self.size > self.max_bytes:
+            _, (_, evicted) = self._data.popitem(last=False)
+            self.size -= len(evicted)
+
+    def delete(self, key: str) -> None:
+        entry = self._data.pop(key, None)
+        if entry is not None:
+            self.size -= len(entry[1])
+
+    def clear(self) -> None:
+        self._data.clear()
+        self.size = 0
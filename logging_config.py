@@ -0,0 +1,148 @@
+"""
+Настройка loguru. Обработчик в вызывающем потоке только кладёт запись в queue.Queue;
+форматирование (текст или JSON), трассировки исключений и запись в stderr и файл делает
+фоновый поток. enqueue=True loguru здесь не подходит: он форматирует и сериализует запись
+в вызывающем потоке, а потом ещё и pickle'ит её в multiprocessing-очередь.
+Каждая запись несёт request_id текущего запроса (его выставляет RequestIdMiddleware).
+"""
+import asyncio
+import copy
+import queue
+import random
+import sys
+import threading
+import traceback
+from contextvars import ContextVar
+
+import orjson
+from loguru import logger
+
+# id запроса, в рамках которого сделана запись ("-" - вне запроса)
+request_id_var: ContextVar[str] = ContextVar("request_id", default="-")
+
+# сколько записей фоновый поток пишет за один вызов
+_BATCH_SIZE = 512
+
+
+def _patch_request_id(record) -> None:
+    record["extra"].setdefault("request_id", request_id_var.get())
+
+
+def _sampling_filter(rates: dict[str, float]):
+    # выполняется в вызывающем потоке уже после форматирования сообщения и патчера, зато
+    # до постановки в очередь; обработчик один, так что решение одно на все выходы
+    def accept(record) -> bool:
+        rate = rates.get(record["level"].name)
+        return rate is None or random.random() < rate
+
+    return accept
+
+
+def format_text(record) -> str:
+    line = (f"{record['time']:%Y-%m-%d %H:%M:%S}.{record['time'].microsecond // 1000:03d} | "
+            f"{record['level'].name: <8} | {record['extra'].get('request_id', '-')} | "
+            f"{record['name']}:{record['function']}:{record['line']} - {record['message']}\n")
+    exception = record["exception"]
+    if exception is not None:
+        line += "".join(traceback.format_exception(exception.type, exception.value, exception.traceback))
+    return line
+
+
+def format_json(record) -> str:
+    exception = record["exception"]
+    data = {
+        "time": record["time"].isoformat(),
+        "level": record["level"].name,
+        "message": record["message"],
+        "name": record["name"],
+        "function": record["function"],
+        "line": record["line"],
+        "extra": record["extra"],
+        "exception": None if exception is None else
+        "".join(traceback.format_exception(exception.type, exception.value, exception.traceback)),
+    }
+    return orjson.dumps(data, default=str).decode() + "\n"
+
+
+class BackgroundSink:
+    """
+    Sink loguru: запись уходит в очередь, фоновый поток форматирует её и передаёт writer -
+    отдельному логгеру loguru с настоящими выходами (stderr, файл с ротацией).
+    """
+
+    def __init__(self, writer, serialize: bool):
+        self._writer = writer.opt(raw=True)
+        self._format = format_json if serialize else format_text
+        self._queue: queue.Queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self._thread.start()
+
+    def write(self, message) -> None:
+        self._queue.put(message.record)
+
+    def _run(self) -> None:
+        while True:
+            records = [self._queue.get()]
+            while len(records) < _BATCH_SIZE:
+                try:
+                    records.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                lines = "".join(self._format(record) for record in records if record is not None)
+                if lines:
+                    self._writer.info(lines)
+            except Exception:
+                traceback.print_exc(file=sys.__stderr__)
+            finally:
+                for _ in records:
+                    self._queue.task_done()
+            if records[-1] is None:
+                return
+
+    def stop(self) -> None:
+        # logger.remove(): дописываем то, что осталось в очереди
+        self._queue.put(None)
+        self._thread.join()
+
+    async def complete(self) -> None:
+        # await logger.complete(): ждём, пока поток запишет всё поставленное
+        await asyncio.to_thread(self._queue.join)
+
+
+def create_sink(serialize: bool, *outputs: tuple) -> BackgroundSink:
+    """
+    BackgroundSink, пишущий в outputs - пары (sink, параметры logger.add) для отдельного
+    логгера. Вызывать, когда у logger нет обработчиков (после logger.remove()).
+    """
+    writer = copy.deepcopy(logger)
+    for sink, options in outputs:
+        writer.add(sink, level=0, format="{message}", colorize=False, **options)
+    return BackgroundSink(writer, serialize)
+
+
+def setup_logging() -> None:
+    """
+    Заменяет обработчик loguru по умолчанию (синхронный stderr) на BackgroundSink, который
+    пишет в stderr и, если задан LOG_FILE, в файл с ротацией. При LOG_JSON записи пишутся в JSON.
+    """
+    # config - здесь, чтобы BackgroundSink можно было использовать без полного окружения (бенчмарки)
+    import config
+
+    logger.remove()
+    outputs = [(sys.stderr, {})]
+    if config.LOG_FILE:
+        outputs.append((config.LOG_FILE, dict(rotation=config.LOG_ROTATION)))
+    sink = create_sink(config.LOG_JSON, *outputs)
+    logger.configure(patcher=_patch_request_id)
+    logger.add(
+        sink,
+        level=config.LOG_LEVEL,
+        # сообщение форматирует фоновый поток; пустой формат - чтобы loguru не делал этого сам
+        format=lambda record: "",
+        filter=_sampling_filter({"DEBUG": config.LOG_SAMPLE_DEBUG, "INFO": config.LOG_SAMPLE_INFO}),
+        colorize=False,
+        # трассировки форматирует traceback из стандартной библиотеки, без значений переменных
+        backtrace=False,
+        diagnose=False,
+    )
@@ -1,29 +1,77 @@
 import os
+import asyncio
+import hmac
+from contextlib import asynccontextmanager
 from loguru import logger
-from fastapi import FastAPI, Query, HTTPException, Request, Response, Depends, status
+from fastapi import FastAPI, Query, HTTPException, Request, Response, Depends, Header, status
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.requests import HTTPConnection
 from typing import Optional
 
 import config
 from app.routers import playlists, songs, users
-from utils import vk_search, mail_ru_search
-from auth import get_current_user
+from concurrent.futures import ThreadPoolExecutor
+from auth import get_token_user
 from app.models.models import User as UserModel
-import httpx
+from http_client import create_upstream_transport, create_upstream_client, get_upstream_transport, InstrumentedTransport
+from http_client import upstream_pool_stats
 from utils import ExternalServiceError
-from middlewares import ThrottlingMiddleware
+from middlewares import ThrottlingMiddleware, MetricsMiddleware, RequestIdMiddleware, REQUEST_ID_HEADER
+from metrics import render_metrics
+from rate_limit import RateLimiter, LocalRateLimiter, parse_rules, RATE_LIMIT_HEADERS
+from resilience import CircuitBreaker, RetryBudget
+from providers import MailRuProvider, VkProvider, federated_search
+from pagination import NEXT_CURSOR_HEADER
+from database import db_pool_stats
 from redis_cache import redis_client
-from redis_cache import make_cache_key, cache_set, cache_get
+from redis_cache import make_cache_key, cache_get_or_fetch, cache_stats, listen_invalidations, local_cache
+from logging_config import setup_logging
+
+
+setup_logging()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # подписка на инвалидации L1-кеша от других воркеров
+    invalidation_listener = asyncio.create_task(listen_invalidations())
+    app.state.upstream_transport = create_upstream_transport()
+    app.state.upstream_client = create_upstream_client(app.state.upstream_transport)
+    # пул потоков для блокирующих SDK провайдеров (vkpymusic)
+    executor = ThreadPoolExecutor(max_workers=config.VK_THREADS, thread_name_prefix="vk")
+    app.state.providers = {
+        "mailru": MailRuProvider(app.state.upstream_client, mailru_breaker, deadline=config.MAILRU_DEADLINE,
+                                 url=config.MAILRU_SEARCH_URL),
+        "vk": VkProvider(executor, deadline=config.VK_DEADLINE),
+    }
+    yield
+    invalidation_listener.cancel()
+    await app.state.upstream_client.aclose()
+    executor.shutdown(wait=False, cancel_futures=True)
+    # дописываем записи, оставшиеся в очереди логов
+    await logger.complete()
 
 
-logger.add('logs/main.log', rotation='10mb', level='DEBUG')
-
 app = FastAPI(
     title="Music service",
     version="0.1.0",
+    lifespan=lifespan,
 )
 
-client = httpx.AsyncClient(timeout=10.0)
+# общий для всех запросов к mail.ru в этом воркере; открытое состояние делится через Redis
+mailru_breaker = CircuitBreaker(
+    "mailru",
+    redis_client,
+    window_seconds=config.BREAKER_WINDOW,
+    min_requests=config.BREAKER_MIN_REQUESTS,
+    error_rate=config.BREAKER_ERROR_RATE,
+    slow_call_seconds=config.BREAKER_SLOW_CALL,
+    slow_call_rate=config.BREAKER_SLOW_CALL_RATE,
+    open_seconds=config.BREAKER_OPEN_SECONDS,
+    retry_budget=RetryBudget(config.UPSTREAM_RETRY_RATIO),
+    max_retries=config.UPSTREAM_MAX_RETRIES,
+    hedge=config.UPSTREAM_HEDGE,
+)
 
 origins = ["http://localhost:5173",
            "http://127.0.0.1:5173"
@@ -34,15 +82,66 @@ app.add_middleware(
     allow_origins=origins,
     allow_credentials=True,
     allow_methods=["*"],
-    allow_headers=["*"]
+    allow_headers=["*"],
+    # курсор следующей страницы списков плейлистов и песен, id запроса и состояние лимита запросов
+    expose_headers=[NEXT_CURSOR_HEADER, REQUEST_ID_HEADER, *RATE_LIMIT_HEADERS],
 )
+
+
+# значения bool-параметров запроса, которые FastAPI считает истиной
+_TRUE_FLAGS = ("1", "true", "on", "yes")
+
+
+def _provider_names(mailru: bool, vk: bool) -> list[str]:
+    return [name for name, enabled in (('mailru', mailru), ('vk', vk)) if enabled]
+
+
+def search_probe_key(connection: HTTPConnection) -> str | None:
+    """
+    Ключ кеша /search, который ThrottlingMiddleware прочитает из Redis вместе с проверкой лимита.
+    Если ответ уже есть в L1, Redis для него не нужен.
+    """
+    if connection.scope["path"] != "/search":
+        return None
+    params = connection.query_params
+    q = params.get("q")
+    names = _provider_names(params.get("mailru", "true").lower() in _TRUE_FLAGS,
+                            params.get("vk", "false").lower() in _TRUE_FLAGS)
+    if not q or not names:
+        return None
+    key = make_cache_key(q, '+'.join(names))
+    if local_cache.get(key) is not None:
+        return None
+    return key
+
+
+throttling_rules = parse_rules(config.THROTTLING_RULES, config.THROTTLING_LIMIT, config.THROTTLING_LIMIT_TIME)
 app.add_middleware(
     ThrottlingMiddleware,
-    redis_client=redis_client,
-    limit=config.THROTTLING_LIMIT,
-    window_seconds=config.THROTTLING_LIMIT_TIME,
-    allowed_origin = origins[0]
+    limiter=RateLimiter(redis_client, throttling_rules),
+    local_limiter=LocalRateLimiter(throttling_rules) if config.THROTTLING_LOCAL_PRECHECK else None,
+    trusted_hops=config.THROTTLING_TRUSTED_HOPS,
+    allowed_origin = origins[0],
+    probe_key=search_probe_key,
 )
+# снаружи остальных middleware, чтобы учитывать и отклонённые лимитом запросы
+app.add_middleware(MetricsMiddleware)
+# id запроса в логах всех middleware и обработчиков
+app.add_middleware(RequestIdMiddleware)
+if config.PROFILING_ENABLED:
+    from profiling import ProfilingMiddleware
+    from app.routers import profiles
+
+    app.add_middleware(
+        ProfilingMiddleware,
+        profiles_dir=config.PROFILING_DIR,
+        token=config.PROFILING_TOKEN,
+        sample_rate=config.PROFILING_SAMPLE_RATE,
+        interval=config.PROFILING_INTERVAL,
+        max_files=config.PROFILING_MAX_FILES,
+        max_age=config.PROFILING_MAX_AGE,
+    )
+    app.include_router(profiles.router)
 
 app.include_router(playlists.router)
 app.include_router(songs.router)
@@ -55,27 +154,62 @@ async def home():
 
 
 @app.get('/search')
-async def search(q: str,
+async def search(request: Request,
+                 q: str,
                  mailru: Optional[bool] = True,
+                 vk: Optional[bool] = False,
                  mcount: int = Query(100, gt=0, le=300),
-                 current_user: UserModel = Depends(get_current_user)
+                 current_user: UserModel = Depends(get_token_user)
                  ):
-    logger.debug(f"query={q}; mail.ru={mailru};")
-
-    key: str = make_cache_key(q, mcount, 'mailru' if mailru else 'default')
-    cached = await cache_get(key)  # list[dict] | None
-
-    if cached is not None:
-        return cached
-
-    if mailru:
-        try:
-            items = await mail_ru_search(client, q, count=mcount)
-            await cache_set(key, items)
-            return items
-        except ExternalServiceError as e:
-            raise HTTPException(status_code=502, detail=str(e))
-
+    # ниже LOG_LEVEL аргументы не подставляются; сэмплирование (LOG_SAMPLE_DEBUG) отбрасывает
+    # запись уже после подстановки, но до форматирования строки лога
+    logger.debug("query={}; mail.ru={}; vk={};", q, mailru, vk)
+
+    names = _provider_names(mailru, vk)
+    if not names:
+        return None
+    providers = [request.app.state.providers[name] for name in names]
+
+    key: str = make_cache_key(q, '+'.join(names))
+    # запись кеша, уже прочитанная ThrottlingMiddleware в одном round trip с проверкой лимита
+    probe = getattr(request.state, "cache_probe", None)
+
+    try:
+        # при промахе к провайдерам уходит только один запрос на ключ, остальные ждут его результат
+        payload = await cache_get_or_fetch(key, mcount, lambda count: federated_search(providers, q, count), probe)
+        # в кеше уже готовый JSON - отдаём как есть, без повторной сериализации
+        return Response(content=payload, media_type="application/json")
+    except ExternalServiceError as e:
+        raise HTTPException(status_code=502, detail=str(e))
+
+
+def require_metrics_token(authorization: Optional[str] = Header(None)):
+    if not config.METRICS_TOKEN:
+        return
+    scheme, _, token = (authorization or "").partition(" ")
+    if scheme.lower() != "bearer" or not hmac.compare_digest(token, config.METRICS_TOKEN):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid metrics token",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+
+@app.get("/stats", summary="Worker stats", description="Счётчики кеша поиска, пулы соединений к mail.ru и базе текущего воркера",
+         dependencies=[Depends(require_metrics_token)])
+async def stats(transport: InstrumentedTransport = Depends(get_upstream_transport)):
+    return {"pid": os.getpid(),
+            "cache": {**cache_stats, "local_entries": len(local_cache), "local_bytes": local_cache.size},
+            "upstream": {**upstream_pool_stats(transport), "breaker": mailru_breaker.state},
+            "db": db_pool_stats(),
+            }
+
+
+@app.get("/metrics", include_in_schema=False, dependencies=[Depends(require_metrics_token)])
+async def metrics():
+    """Метрики в формате Prometheus, собранные по всем воркерам gunicorn."""
+    content, media_type = render_metrics()
+    return Response(content=content, media_type=media_type)
 
 
 @app.get("/health", summary="Healthcheck", description="Проверка работоспособности сервиса")
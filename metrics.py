@@ -0,0 +1,73 @@
+"""
+Метрики Prometheus. Под gunicorn с несколькими воркерами задаётся PROMETHEUS_MULTIPROC_DIR:
+каждый воркер пишет значения в свои файлы в этом каталоге, а /metrics в любом воркере
+собирает их по всем воркерам (gunicorn.conf.py чистит каталог и файлы завершившихся воркеров).
+"""
+import os
+
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram
+from prometheus_client import generate_latest, multiprocess
+
+# бакеты для быстрых операций (Redis, SQL, ожидание пула), секунды
+_FAST_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "Время обработки HTTP-запроса",
+    ["method", "route", "status"],
+)
+UPSTREAM_LATENCY = Histogram(
+    "upstream_request_duration_seconds",
+    "Время ответа провайдера поиска (с повторами и хеджированием)",
+    ["provider"],
+)
+UPSTREAM_ERRORS = Counter(
+    "upstream_errors_total",
+    "Неудачные запросы к провайдерам поиска",
+    ["provider", "reason"],
+)
+CACHE_REQUESTS = Counter(
+    "search_cache_requests_total",
+    "Обращения к кешу поиска по результату: local_hit, hit, stale, miss, stale_if_error",
+    ["result"],
+)
+DB_STATEMENT_LATENCY = Histogram(
+    "db_statement_duration_seconds",
+    "Время выполнения SQL-выражения",
+    ["operation"],
+    buckets=_FAST_BUCKETS,
+)
+DB_POOL_CHECKOUT_WAIT = Histogram(
+    "db_pool_checkout_wait_seconds",
+    "Ожидание свободного соединения из пула базы",
+    buckets=_FAST_BUCKETS,
+)
+# livesum - сумма по живым воркерам
+DB_POOL_CHECKED_OUT = Gauge(
+    "db_pool_checked_out_connections",
+    "Соединения с базой, занятые запросами",
+    multiprocess_mode="livesum",
+)
+DB_POOL_OPEN = Gauge(
+    "db_pool_open_connections",
+    "Открытые соединения с базой (в пуле и занятые)",
+    multiprocess_mode="livesum",
+)
+RATE_LIMIT_REJECTIONS = Counter(
+    "rate_limit_rejections_total",
+    "Запросы, отклонённые лимитом (source: local - без Redis, redis - общим лимитом)",
+    ["source"],
+)
+
+
+def render_metrics() -> tuple[bytes, str]:
+    """
+    Текст метрик в формате Prometheus и его content type.
+    """
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
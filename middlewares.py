@@ -1,63 +1,156 @@
+import re
 import time
-from fastapi import Request
+import uuid
+from typing import Callable
 from fastapi.responses import JSONResponse
-from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.requests import HTTPConnection
 import redis
+from rate_limit import RateLimiter, LocalRateLimiter, RateLimitResult, client_identity
 from loguru import logger
-import config
+from metrics import RATE_LIMIT_REJECTIONS, REQUEST_LATENCY
+from logging_config import request_id_var
 
+REQUEST_ID_HEADER = "X-Request-ID"
+# id от прокси принимаем, только если он похож на id, а не на произвольную строку в логах
+_REQUEST_ID_RE = re.compile(rb"^[A-Za-z0-9._-]{1,64}$")
+
+
+class RequestIdMiddleware:
+    """
+    Выставляет id запроса для логов (из X-Request-ID прокси или новый) и возвращает его
+    клиенту в X-Request-ID.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = dict(scope["headers"]).get(REQUEST_ID_HEADER.lower().encode())
+        if request_id is None or not _REQUEST_ID_RE.match(request_id):
+            request_id = uuid.uuid4().hex.encode()
+        header = (REQUEST_ID_HEADER.lower().encode(), request_id)
+
+        async def send_with_request_id(message):
+            if message["type"] == "http.response.start":
+                message = {**message, "headers": [*message.get("headers", []), header]}
+            await send(message)
+
+        token = request_id_var.set(request_id.decode())
+        try:
+            await self.app(scope, receive, send_with_request_id)
+        finally:
+            request_id_var.reset(token)
+
+
+class MetricsMiddleware:
+    """
+    Гистограмма времени запросов по шаблону маршрута (/playlists/{playlist_id}, а не по
+    фактическому пути - иначе число рядов метрики не ограничено).
+    """
 
-class TimingMiddleware:
     def __init__(self, app):
         self.app = app
 
     async def __call__(self, scope, receive, send):
-        start_time = time.time()
-        await self.app(scope, receive, send)
-        duration = time.time() - start_time
-        print(f"Request duration: {duration:.10f} seconds")
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
 
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # маршрут кладёт в scope роутер FastAPI; запросы мимо маршрутов и отклонённые
+            # до роутинга (429) попадают в один ряд
+            route = scope.get("route")
+            REQUEST_LATENCY.labels(
+                scope["method"],
+                route.path if route is not None else "unmatched",
+                str(status_code),
+            ).observe(time.perf_counter() - start)
 
-class ThrottlingMiddleware(BaseHTTPMiddleware):
+
+class ThrottlingMiddleware:
     def __init__(
         self,
         app,
-        redis_client: redis.Redis,
-        limit: int,
-        window_seconds: int,
+        limiter: RateLimiter,
+        local_limiter: LocalRateLimiter | None = None,
+        trusted_hops: int = 0,
         allowed_origin: str = None,
+        probe_key: Callable[[HTTPConnection], str | None] | None = None,
     ):
-        super().__init__(app)
-        self.redis = redis_client
-        self.limit = limit
-        self.window = window_seconds
+        self.app = app
+        self.limiter = limiter
+        self.local_limiter = local_limiter  # предварительная проверка без Redis
+        self.trusted_hops = trusted_hops  # сколько прокси перед приложением дописывают X-Forwarded-For
         self.allowed_origin = allowed_origin  # нужен для CORS
+        # ключ кеша, который стоит прочитать вместе с проверкой лимита (результат - в scope["state"])
+        self.probe_key = probe_key
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] == "OPTIONS":
+            await self.app(scope, receive, send)
+            return
 
-    async def dispatch(self, request: Request, call_next):
-        if request.method == "OPTIONS":
-            return await call_next(request)
+        connection = HTTPConnection(scope)
+        identity = client_identity(connection, self.trusted_hops)
+        path = scope["path"]
+        if self.local_limiter is not None:
+            result = self.local_limiter.check(identity, path)
+            if result is not None:
+                await self._reject(result, "local", scope, receive, send)
+                return
 
-        client_ip = request.client.host
-        key = f"throttle:{client_ip}"
+        probe_key = self.probe_key(connection) if self.probe_key is not None else None
+        try:
+            result = await self.limiter.hit(identity, path, probe_key)
+        except redis.RedisError as e:
+            # без Redis лимиты не считаем, но сервис продолжает отвечать
+            logger.warning(f"rate limiter unavailable: {e!r}")
+            await self.app(scope, receive, send)
+            return
 
-        # увеличение счётчика у ключа (по достижении порога TTL ключ сам удалится)
-        current = await self.redis.incr(key)
+        if not result.allowed:
+            await self._reject(result, "redis", scope, receive, send)
+            return
+        if self.local_limiter is not None:
+            self.local_limiter.record(identity, path)
+        if result.cache_probe is not None:
+            scope.setdefault("state", {})["cache_probe"] = (probe_key, *result.cache_probe)
 
-        # при первом вызове устанавливем TTL у ключа
-        if current == 1:
-            await self.redis.expire(key, self.window)
+        extra_headers = [(name.lower().encode("latin-1"), value.encode("latin-1"))
+                         for name, value in result.headers().items()]
 
-        if current > self.limit:
-            response = JSONResponse(
-                status_code=429,
-                content={"detail": "Too many requests"}
-            )
-            # CORS заголовки, чтобы fetch с credentials видел ответ
-            if self.allowed_origin:
-                response.headers["Access-Control-Allow-Origin"] = self.allowed_origin
-                response.headers["Access-Control-Allow-Credentials"] = "true"
-            return response
+        async def send_with_headers(message):
+            # заголовки дописываем прямо в http.response.start, тело (в т.ч. потоковое) идёт как есть
+            if message["type"] == "http.response.start":
+                message = {**message, "headers": [*message.get("headers", []), *extra_headers]}
+            await send(message)
 
-        response = await call_next(request)
-        return response
+        await self.app(scope, receive, send_with_headers)
 
+    async def _reject(self, result: RateLimitResult, source: str, scope, receive, send):
+        RATE_LIMIT_REJECTIONS.labels(source).inc()
+        response = JSONResponse(
+            status_code=429,
+            content={"detail": "Too many requests"},
+            headers=result.headers(),
+        )
+        # CORS заголовки, чтобы fetch с credentials видел ответ
+        if self.allowed_origin:
+            response.headers["Access-Control-Allow-Origin"] = self.allowed_origin
+            response.headers["Access-Control-Allow-Credentials"] = "true"
+        await response(scope, receive, send)
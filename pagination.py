@@ -0,0 +1,48 @@
+"""
+Курсорная (keyset) пагинация: курсор - непрозрачная строка с ключом сортировки
+последней отданной строки.
+"""
+import base64
+import binascii
+from datetime import datetime
+
+import orjson
+from fastapi import HTTPException, Response, status
+
+import config
+
+# заголовок, в котором отдаётся курсор следующей страницы
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(*values) -> str:
+    data = orjson.dumps([v.isoformat() if isinstance(v, datetime) else v for v in values])
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+def decode_cursor(cursor: str, *types: type) -> tuple:
+    """
+    Разбирает курсор в значения указанных типов (int, datetime).
+    Битый курсор - 400.
+    """
+    try:
+        values = orjson.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        if len(values) != len(types):
+            raise ValueError(cursor)
+        return tuple(datetime.fromisoformat(v) if t is datetime else t(v) for v, t in zip(values, types))
+    except (ValueError, TypeError, binascii.Error, orjson.JSONDecodeError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+
+def page_size(limit: int | None) -> int:
+    # клиенты без limit получают страницу по умолчанию, а не всю таблицу
+    return limit or config.PAGE_SIZE_DEFAULT
+
+
+def set_next_cursor(response: Response, rows: list, limit: int, *key_values) -> None:
+    """
+    Если страница заполнена целиком, отдаёт курсор следующей страницы в заголовке.
+    key_values - ключ сортировки последней строки.
+    """
+    if len(rows) == limit:
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(*key_values)
@@ -0,0 +1,98 @@
+"""
+Профилирование отдельных запросов pyinstrument'ом. Middleware подключается только при
+PROFILING_ENABLED, поэтому в обычном режиме накладных расходов нет.
+
+Профилируется запрос с заголовком X-Profile-Token (равным PROFILING_TOKEN) или случайная
+доля PROFILING_SAMPLE_RATE запросов. В async-режиме pyinstrument учитывает время ожидания
+в await (база, Redis, upstream) как время вызвавшей функции, так что видно, где запрос
+провёл время по часам, а не только на CPU. Профиль сохраняется в PROFILING_DIR в формате
+speedscope (https://www.speedscope.app) и скачивается через /profiles. После записи старые
+профили удаляются: хранится не больше max_files файлов и не старше max_age секунд.
+"""
+import asyncio
+import hmac
+import random
+import re
+import time
+import uuid
+from pathlib import Path
+
+from loguru import logger
+from pyinstrument import Profiler
+from pyinstrument.renderers import SpeedscopeRenderer
+
+PROFILE_TOKEN_HEADER = "X-Profile-Token"
+PROFILE_ID_HEADER = "X-Profile-Id"
+
+
+def check_profile_token(token: str | None, expected: str) -> bool:
+    return bool(expected) and token is not None and hmac.compare_digest(token, expected)
+
+
+def _prune_profiles(profiles_dir: Path, max_files: int, max_age: float) -> None:
+    """Удаляет профили старше max_age секунд и сверх max_files самых новых (0 - без ограничения)."""
+    profiles = []
+    for path in profiles_dir.glob("*.speedscope.json"):
+        try:
+            profiles.append((path.stat().st_mtime, path))
+        except FileNotFoundError:
+            # удалил другой воркер
+            continue
+    profiles.sort(reverse=True)
+    oldest = time.time() - max_age
+    for i, (mtime, path) in enumerate(profiles):
+        if (max_files and i >= max_files) or (max_age and mtime < oldest):
+            path.unlink(missing_ok=True)
+
+
+def _save_profile(profiler: Profiler, path: Path, max_files: int = 0, max_age: float = 0) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(profiler.output(SpeedscopeRenderer()))
+    _prune_profiles(path.parent, max_files, max_age)
+
+
+class ProfilingMiddleware:
+    def __init__(self, app, profiles_dir: str, token: str = "", sample_rate: float = 0.0, interval: float = 0.001,
+                 max_files: int = 0, max_age: float = 0):
+        self.app = app
+        self.profiles_dir = Path(profiles_dir)
+        self.token = token
+        self.sample_rate = sample_rate
+        self.interval = interval  # период сэмплирования стека, секунды
+        self.max_files = max_files  # сколько профилей хранить (0 - без ограничения)
+        self.max_age = max_age  # сколько секунд хранить профиль (0 - без ограничения)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope["headers"])
+        token = headers.get(PROFILE_TOKEN_HEADER.lower().encode())
+        requested = check_profile_token(token.decode("latin-1") if token else None, self.token)
+        if not requested and random.random() >= self.sample_rate:
+            await self.app(scope, receive, send)
+            return
+
+        profile_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{re.sub(r'[^A-Za-z0-9]+', '_', scope['path']).strip('_')}" \
+                     f"-{uuid.uuid4().hex[:8]}"
+
+        async def send_with_profile_id(message):
+            # id профиля получает только тот, кто его запросил токеном
+            if requested and message["type"] == "http.response.start":
+                message = {**message, "headers": [*message.get("headers", []),
+                                                   (PROFILE_ID_HEADER.lower().encode(), profile_id.encode())]}
+            await send(message)
+
+        profiler = Profiler(interval=self.interval, async_mode="enabled")
+        profiler.start()
+        try:
+            await self.app(scope, receive, send_with_profile_id)
+        finally:
+            profiler.stop()
+            path = self.profiles_dir / f"{profile_id}.speedscope.json"
+            try:
+                # рендер и запись на диск - вне event loop
+                await asyncio.to_thread(_save_profile, profiler, path, self.max_files, self.max_age)
+            except Exception as e:
+                logger.warning(f"failed to save profile {path}: {e!r}")
@@ -0,0 +1,120 @@
+"""
+Провайдеры поиска музыки и федеративный поиск по нескольким из них.
+"""
+import asyncio
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+from loguru import logger
+
+from metrics import UPSTREAM_LATENCY, UPSTREAM_ERRORS
+from resilience import CircuitBreaker, CircuitOpenError
+from utils import MusicItem, DegradedResults, ExternalServiceError, mail_ru_search, vk_search, normalize_query
+
+# константа reciprocal rank fusion: чем больше, тем меньше влияние позиции в выдаче
+_RRF_K = 60
+
+
+class SearchProvider(ABC):
+    name: str
+
+    def __init__(self, deadline: float):
+        # сколько ждём провайдера, прежде чем отдать ответ без него
+        self.deadline = deadline
+
+    @abstractmethod
+    async def search(self, query: str, count: int) -> list[MusicItem]:
+        ...
+
+
+class MailRuProvider(SearchProvider):
+    name = "mailru"
+
+    def __init__(self, client: httpx.AsyncClient, breaker: CircuitBreaker, deadline: float, url: str):
+        super().__init__(deadline)
+        self.client = client
+        self.breaker = breaker
+        self.url = url  # MAILRU_SEARCH_URL
+
+    async def search(self, query: str, count: int) -> list[MusicItem]:
+        return await self.breaker.call(lambda: mail_ru_search(self.client, query, count=count, url=self.url))
+
+
+class VkProvider(SearchProvider):
+    name = "vk"
+
+    def __init__(self, executor: ThreadPoolExecutor, deadline: float):
+        super().__init__(deadline)
+        self.executor = executor
+
+    async def search(self, query: str, count: int) -> list[MusicItem]:
+        # vkpymusic синхронный - уводим его с event loop в пул потоков
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, vk_search, query, count)
+
+
+async def _search_within_deadline(provider: SearchProvider, query: str, count: int) -> list[MusicItem]:
+    start = time.perf_counter()
+    try:
+        return await asyncio.wait_for(provider.search(query, count), provider.deadline)
+    except asyncio.TimeoutError as e:
+        UPSTREAM_ERRORS.labels(provider.name, "timeout").inc()
+        raise ExternalServiceError(f"{provider.name} did not respond in {provider.deadline}s") from e
+    except CircuitOpenError:
+        UPSTREAM_ERRORS.labels(provider.name, "circuit_open").inc()
+        raise
+    except ExternalServiceError:
+        UPSTREAM_ERRORS.labels(provider.name, "error").inc()
+        raise
+    finally:
+        UPSTREAM_LATENCY.labels(provider.name).observe(time.perf_counter() - start)
+
+
+def _dedup_key(item: MusicItem) -> tuple[str, str, int]:
+    return normalize_query(item['author'] or ''), normalize_query(item['name'] or ''), item['duration']
+
+
+def merge_results(results: list[list[MusicItem]], count: int) -> list[MusicItem]:
+    """
+    Объединяет выдачи провайдеров в один список (reciprocal rank fusion): трек, найденный
+    несколькими провайдерами, поднимается выше. Дубликаты по автору, названию и длительности
+    схлопываются, остаётся вариант провайдера, который идёт раньше в списке.
+    """
+    scores: dict[tuple[str, str, int], float] = {}
+    items: dict[tuple[str, str, int], MusicItem] = {}
+    for provider_items in results:
+        for rank, item in enumerate(provider_items):
+            key = _dedup_key(item)
+            scores[key] = scores.get(key, 0) + 1 / (_RRF_K + rank)
+            items.setdefault(key, item)
+    ranked = sorted(scores, key=scores.get, reverse=True)
+    return [items[key] for key in ranked[:count]]
+
+
+async def federated_search(providers: list[SearchProvider], query: str, count: int) -> list[MusicItem]:
+    """
+    Опрашивает провайдеров параллельно, каждого не дольше его deadline, и объединяет выдачи.
+    Упавший или не успевший провайдер пропускается, а выдача возвращается как DegradedResults;
+    ошибка - только если не ответил никто.
+    """
+    if len(providers) == 1:
+        return await _search_within_deadline(providers[0], query, count)
+
+    responses = await asyncio.gather(
+        *(_search_within_deadline(provider, query, count) for provider in providers),
+        return_exceptions=True,
+    )
+    results = []
+    for provider, response in zip(providers, responses):
+        if isinstance(response, ExternalServiceError):
+            logger.warning(f"search provider {provider.name} skipped: {response}")
+        elif isinstance(response, BaseException):
+            raise response
+        else:
+            results.append(response)
+    if not results:
+        raise ExternalServiceError("All search providers failed")
+    merged = merge_results(results, count)
+    return DegradedResults(merged) if len(results) < len(providers) else merged
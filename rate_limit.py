@@ -0,0 +1,195 @@
+"""
+Ограничение частоты запросов по алгоритму GCRA. Проверка и обновление состояния - один
+Lua-скрипт, то есть один round trip в Redis и никаких ключей без TTL.
+"""
+import math
+import time
+from collections import OrderedDict
+from typing import NamedTuple
+
+import redis.asyncio as redis
+from starlette.requests import HTTPConnection
+
+from auth import decode_access_token
+
+# GCRA хранит одно число - теоретическое время прихода следующего запроса (TAT, мс).
+# Запрос пропускается, если TAT опережает текущее время не больше чем на period.
+# Время берётся из Redis, чтобы часы воркеров не влияли на результат.
+# Возвращает {пропущен, осталось запросов, через сколько мс повторить, через сколько мс лимит восстановится}.
+# Если передан KEYS[2], для пропущенного запроса в том же вызове читаются значение и TTL этого
+# ключа кеша - запрос к /search из кеша обходится одним round trip в Redis.
+_GCRA_SCRIPT = """
+local interval = tonumber(ARGV[1])
+local period = tonumber(ARGV[2])
+local t = redis.call('TIME')
+local now = t[1] * 1000 + math.floor(t[2] / 1000)
+local tat = tonumber(redis.call('GET', KEYS[1]))
+if tat == nil or tat < now then
+    tat = now
+end
+local new_tat = tat + interval
+local allow_at = new_tat - period
+if now < allow_at then
+    return {0, 0, allow_at - now, tat - now}
+end
+redis.call('SET', KEYS[1], new_tat, 'PX', math.ceil(new_tat - now))
+local result = {1, math.floor((now - allow_at) / interval), 0, new_tat - now}
+if KEYS[2] then
+    table.insert(result, redis.call('GET', KEYS[2]))
+    table.insert(result, redis.call('TTL', KEYS[2]))
+end
+return result
+"""
+
+
+RATE_LIMIT_HEADERS = ["RateLimit-Limit", "RateLimit-Remaining", "RateLimit-Reset", "Retry-After"]
+
+
+class RateLimitRule(NamedTuple):
+    # префикс пути, к которому относится правило ("" - все остальные пути)
+    prefix: str
+    limit: int
+    period: int  # секунды
+
+
+class RateLimitResult(NamedTuple):
+    allowed: bool
+    limit: int
+    remaining: int
+    retry_after: float  # секунды
+    reset: float  # секунды до полного восстановления лимита
+    # (значение, TTL) ключа кеша, прочитанного вместе с проверкой лимита
+    cache_probe: tuple[bytes | None, int] | None = None
+
+    def headers(self) -> dict[str, str]:
+        headers = {
+            "RateLimit-Limit": str(self.limit),
+            "RateLimit-Remaining": str(self.remaining),
+            "RateLimit-Reset": str(math.ceil(self.reset)),
+        }
+        if not self.allowed:
+            headers["Retry-After"] = str(math.ceil(self.retry_after))
+        return headers
+
+
+def parse_rules(spec: str, default_limit: int, default_period: int) -> list[RateLimitRule]:
+    """
+    Разбирает правила вида "/users/login=5/60;/search=30/10" (префикс=запросов/секунд).
+    Правило по умолчанию (default_limit запросов за default_period) добавляется последним.
+    """
+    rules = []
+    for item in filter(None, (part.strip() for part in spec.split(";"))):
+        prefix, _, rate = item.partition("=")
+        limit, _, period = rate.partition("/")
+        rules.append(RateLimitRule(prefix.strip(), int(limit), int(period)))
+    # самый длинный подходящий префикс побеждает
+    rules.sort(key=lambda rule: len(rule.prefix), reverse=True)
+    rules.append(RateLimitRule("", default_limit, default_period))
+    return rules
+
+
+def client_ip(connection: HTTPConnection, trusted_hops: int) -> str:
+    """
+    IP клиента с учётом X-Forwarded-For. Доверяем только последним trusted_hops адресам,
+    которые дописали наши прокси (nginx: $proxy_add_x_forwarded_for), - всё левее клиент
+    мог подделать.
+    """
+    peer = connection.client.host if connection.client else "unknown"
+    if trusted_hops <= 0:
+        return peer
+    forwarded = [ip.strip() for ip in connection.headers.get("x-forwarded-for", "").split(",") if ip.strip()]
+    if len(forwarded) < trusted_hops:
+        return peer
+    return forwarded[-trusted_hops]
+
+
+def client_identity(connection: HTTPConnection, trusted_hops: int) -> str:
+    """
+    Авторизованные запросы лимитируются по пользователю (id из подписанного access-токена),
+    остальные - по IP.
+    """
+    token = connection.cookies.get("access_token")
+    if token:
+        try:
+            return f"user:{decode_access_token(token)['id']}"
+        except Exception:
+            # невалидный или старый токен - считаем запрос анонимным
+            pass
+    return f"ip:{client_ip(connection, trusted_hops)}"
+
+
+def _matches(prefix: str, path: str) -> bool:
+    # "/users/login" покрывает "/users/login" и "/users/login/...", но не "/users/login-history"
+    return path == prefix or path.startswith(prefix.rstrip("/") + "/")
+
+
+def match_rule(rules: list[RateLimitRule], path: str) -> RateLimitRule:
+    for rule in rules:
+        if _matches(rule.prefix, path):
+            return rule
+    return rules[-1]
+
+
+class RateLimiter:
+    def __init__(self, redis_client: redis.Redis, rules: list[RateLimitRule]):
+        self.redis = redis_client
+        self.rules = rules
+        self._script = redis_client.register_script(_GCRA_SCRIPT)
+
+    async def hit(self, identity: str, path: str, probe_key: str | None = None) -> RateLimitResult:
+        """
+        Учитывает запрос identity к path и сообщает, укладывается ли он в лимит.
+        Если передан probe_key, в том же round trip читает этот ключ кеша (для пропущенных запросов).
+        """
+        rule = match_rule(self.rules, path)
+        key = f"ratelimit:{rule.prefix or '*'}:{identity}"
+        interval = rule.period * 1000 / rule.limit
+        keys = [key] if probe_key is None else [key, probe_key]
+        allowed, remaining, retry_after, reset, *probe = await self._script(
+            keys=keys, args=[interval, rule.period * 1000]
+        )
+        return RateLimitResult(bool(allowed), rule.limit, int(remaining), retry_after / 1000, reset / 1000,
+                               tuple(probe) if probe else None)
+
+
+class LocalRateLimiter:
+    """
+    Тот же GCRA в памяти воркера. Воркер видит только часть запросов клиента, поэтому если
+    лимит превышен уже по ним, общий лимит в Redis превышен и подавно - такой запрос можно
+    отклонить, не ходя в Redis. Ложных отказов нет, а флуд отсекается без round trip.
+    Запросы клиента делятся между воркерами gunicorn, и каждый видит примерно 1/N из них,
+    поэтому срабатывает проверка только при превышении лимита примерно в N раз: она защищает
+    Redis от грубого флуда, а не заменяет общий лимит.
+    """
+
+    def __init__(self, rules: list[RateLimitRule], max_keys: int = 10000):
+        self.rules = rules
+        self.max_keys = max_keys
+        # (identity, префикс правила) -> TAT, секунды monotonic
+        self._tat: OrderedDict[tuple[str, str], float] = OrderedDict()
+
+    def check(self, identity: str, path: str) -> RateLimitResult | None:
+        """
+        Возвращает результат-отказ, если лимит превышен уже в этом воркере, иначе None.
+        """
+        rule = match_rule(self.rules, path)
+        now = time.monotonic()
+        tat = max(self._tat.get((identity, rule.prefix), now), now)
+        allow_at = tat + rule.period / rule.limit - rule.period
+        if now < allow_at:
+            return RateLimitResult(False, rule.limit, 0, allow_at - now, tat - now)
+        return None
+
+    def record(self, identity: str, path: str) -> None:
+        """
+        Учитывает запрос, пропущенный общим лимитом. Отклонённые Redis запросы не учитываются:
+        там они тоже не тратят лимит.
+        """
+        rule = match_rule(self.rules, path)
+        key = (identity, rule.prefix)
+        now = time.monotonic()
+        self._tat[key] = max(self._tat.get(key, now), now) + rule.period / rule.limit
+        self._tat.move_to_end(key)
+        if len(self._tat) > self.max_keys:
+            # самые давние клиенты; их TAT, скорее всего, уже в прошлом
+            self._tat.popitem(last=False)
@@ -1,35 +1,279 @@
 import os
+import asyncio
+import uuid
 import redis.asyncio as redis
-import json
+import orjson
 import hashlib
-from utils import MusicItem
+import zlib
+from typing import Awaitable, Callable
+from utils import MusicItem, DegradedResults, ExternalServiceError, normalize_query
+from local_cache import LocalCache
+from metrics import CACHE_REQUESTS
 import config
+from loguru import logger
 
 
-redis_client = redis.Redis(
+# один явно ограниченный пул на воркер для всех обращений к Redis: при исчерпании запрос
+# ждёт свободное соединение до REDIS_POOL_TIMEOUT, а не открывает новое
+redis_pool = redis.BlockingConnectionPool(
     host=config.REDIS_HOST,
     port=config.REDIS_PORT,
     db=0,
-    decode_responses=True,  # строки вместо bytes
+    max_connections=config.REDIS_MAX_CONNECTIONS,
+    timeout=config.REDIS_POOL_TIMEOUT,
+    health_check_interval=config.REDIS_HEALTH_CHECK_INTERVAL,
 )
 
+# ответы не декодируются: кеш поиска хранит готовые orjson-байты и отдаёт их клиенту как есть
+redis_client = redis.Redis(connection_pool=redis_pool)
 
-def make_cache_key(query: str, limit: int, provider) -> str:
-    raw = f"mailru:search:{query}:{limit}:{provider}"
+# удаляем лок только если он всё ещё наш (мог истечь и достаться другому воркеру)
+_RELEASE_LOCK_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+# префикс сжатых значений; JSON-массив всегда начинается с "[", так что старые несжатые
+# значения читаются как есть
+_COMPRESSED_MAGIC = b"\x00z"
+
+# L1: готовые байты ответа в памяти воркера, попадание не ходит в Redis и не парсит JSON
+local_cache = LocalCache(
+    max_entries=config.L1_CACHE_MAX_ENTRIES,
+    max_bytes=config.L1_CACHE_MAX_BYTES,
+    ttl=config.L1_CACHE_TTL,
+)
+
+# канал, через который воркеры сообщают друг другу об обновлённых ключах
+INVALIDATION_CHANNEL = "search:invalidate"
+_WORKER_ID = uuid.uuid4().hex
+
+# запросы в upstream, которые сейчас выполняются в этом воркере: key -> задача
+_inflight: dict[str, asyncio.Task] = {}
+
+# счётчики обращений к кешу поиска в этом воркере (для подбора CACHE_SOFT_TTL / CACHE_HARD_TTL)
+cache_stats: dict[str, int] = {"local_hit": 0, "hit": 0, "stale": 0, "miss": 0, "stale_if_error": 0}
+
+# пауза между повторными проверками кеша, пока upstream опрашивает другой воркер
+_LOCK_POLL_INTERVAL = 0.05
+
+
+def _count(result: str) -> None:
+    cache_stats[result] += 1
+    CACHE_REQUESTS.labels(result).inc()
+
+
+def make_cache_key(query: str, provider) -> str:
+    # лимит в ключ не входит: запросы с меньшим mcount обслуживаются из большего результата
+    query = normalize_query(query, translit=config.SEARCH_TRANSLIT_FOLD)
+    raw = f"mailru:search:{query}:{provider}"
     digest = hashlib.sha256(raw.encode()).hexdigest()
     return f"search:{digest}"
 
 
-async def cache_get(key: str) -> list[dict] | None:
-    data = await redis_client.get(key)
+def _pack(data: bytes) -> bytes:
+    if 0 < config.CACHE_COMPRESS_THRESHOLD <= len(data):
+        return _COMPRESSED_MAGIC + zlib.compress(data, config.CACHE_COMPRESS_LEVEL)
+    return data
+
+
+def _unpack(raw: bytes) -> bytes:
+    if raw.startswith(_COMPRESSED_MAGIC):
+        return zlib.decompress(raw[len(_COMPRESSED_MAGIC):])
+    return raw
+
+
+# Запись кеша: b"<limit>:<count>:<json>", где limit - сколько элементов запрашивали у upstream,
+# count - сколько он вернул. Заголовок позволяет решить, подходит ли запись под запрос,
+# не разбирая JSON.
+
+def _make_entry(limit: int, items: list[MusicItem]) -> bytes:
+    return f"{limit}:{len(items)}:".encode() + orjson.dumps(items)
+
+
+def _entry_header(entry: bytes) -> tuple[int, int, int]:
+    """Возвращает (limit, count, смещение JSON) записи."""
+    first = entry.index(b":")
+    second = entry.index(b":", first + 1)
+    return int(entry[:first]), int(entry[first + 1:second]), second + 1
+
+
+def _entry_covers(entry: bytes, count: int) -> bool:
+    limit, stored, _ = _entry_header(entry)
+    # upstream вернул меньше, чем просили, - больше результатов по запросу просто нет
+    return limit >= count or stored < limit
+
+
+def _render(entry: bytes, count: int) -> bytes:
+    """JSON-ответ с не более чем count элементами из записи."""
+    _, stored, offset = _entry_header(entry)
+    if stored <= count:
+        return entry[offset:]
+    return orjson.dumps(orjson.loads(entry[offset:])[:count])
+
+
+def _lookup_result(data: bytes | None, ttl: int) -> tuple[bytes | None, bool]:
     if not data:
+        return None, False
+    # запись считается устаревшей, если с момента записи прошло больше CACHE_SOFT_TTL
+    stale = 0 <= ttl < config.CACHE_HARD_TTL - config.CACHE_SOFT_TTL
+    return _unpack(data), stale
+
+
+async def cache_lookup(key: str) -> tuple[bytes | None, bool]:
+    """
+    Возвращает (запись кеша, устарела ли она) за один round trip: GET и TTL идут одним пайплайном.
+    """
+    async with redis_client.pipeline(transaction=False) as pipe:
+        pipe.get(key)
+        pipe.ttl(key)
+        data, ttl = await pipe.execute()
+    return _lookup_result(data, ttl)
+
+
+async def cache_set(key: str, value: list[MusicItem], limit: int) -> bytes:
+    """
+    Сохраняет результат запроса к upstream с лимитом limit в Redis (сжатым, если он больше
+    CACHE_COMPRESS_THRESHOLD) и L1 и рассылает инвалидацию остальным воркерам.
+    Неполная выдача (DegradedResults) свежа только CACHE_DEGRADED_TTL секунд, дальше
+    она устаревшая и обновляется как обычная запись после soft TTL.
+    Возвращает запись кеша.
+    """
+    entry = _make_entry(limit, value)
+    ttl = config.CACHE_HARD_TTL
+    if isinstance(value, DegradedResults):
+        ttl -= config.CACHE_SOFT_TTL - config.CACHE_DEGRADED_TTL
+    async with redis_client.pipeline(transaction=False) as pipe:
+        pipe.set(key, _pack(entry), ex=ttl)
+        pipe.publish(INVALIDATION_CHANNEL, f"{_WORKER_ID}:{key}")
+        await pipe.execute()
+    local_cache.set(key, entry)
+    return entry
+
+
+async def cache_get_or_fetch(key: str,
+                             count: int,
+                             fetch: Callable[[int], Awaitable[list[MusicItem]]],
+                             probe: tuple[str, bytes | None, int] | None = None,
+                             ) -> bytes:
+    """
+    Возвращает JSON-ответ из не более чем count элементов. Подходит любая запись по ключу,
+    полученная с лимитом не меньше count. При промахе вызывает fetch не более одного раза
+    на ключ: внутри воркера конкурентные запросы ждут общую задачу, между воркерами - Redis-лок.
+    Устаревшая (после soft TTL) запись отдаётся сразу, а обновляется в фоне.
+    Если upstream недоступен, отдаётся любая имеющаяся запись по ключу.
+    probe - (ключ, значение, TTL), уже прочитанные из Redis вместе с проверкой лимита запросов;
+    если ключ совпадает, отдельный запрос в Redis не делается.
+    """
+    entry = local_cache.get(key)
+    if entry is not None and _entry_covers(entry, count):
+        _count("local_hit")
+        return _render(entry, count)
+
+    if probe is not None and probe[0] == key:
+        entry, stale = _lookup_result(*probe[1:])
+    else:
+        entry, stale = await cache_lookup(key)
+    if entry is not None and _entry_covers(entry, count):
+        if stale:
+            _count("stale")
+            # обновляем с тем же лимитом, чтобы запись продолжала покрывать прежние запросы
+            _start_fetch(key, max(_entry_header(entry)[0], _fetch_count(count)), fetch)
+        else:
+            _count("hit")
+            local_cache.set(key, entry)
+        return _render(entry, count)
+
+    _count("miss")
+    try:
+        # shield - отключение клиента, который начал запрос в upstream, не должно отменять его
+        # для остальных ожидающих
+        fetched = await asyncio.shield(_start_fetch(key, _fetch_count(count), fetch))
+    except ExternalServiceError:
+        if entry is None:
+            raise
+        # upstream недоступен - лучше отдать то, что есть (меньше элементов), чем 502
+        _count("stale_if_error")
+        return _render(entry, count)
+    return _render(fetched, count)
+
+
+def _fetch_count(count: int) -> int:
+    # при SEARCH_PREFETCH_COUNT upstream сразу запрашивается с максимальным лимитом,
+    # и все меньшие лимиты обслуживаются из одной записи
+    return max(count, config.SEARCH_PREFETCH_COUNT)
+
+
+async def listen_invalidations() -> None:
+    """
+    Фоновая задача воркера: удаляет из L1 ключи, обновлённые другими воркерами.
+    """
+    while True:
+        try:
+            async with redis_client.pubsub() as pubsub:
+                await pubsub.subscribe(INVALIDATION_CHANNEL)
+                # пока не были подписаны, могли пропустить инвалидации
+                local_cache.clear()
+                async for message in pubsub.listen():
+                    if message["type"] != "message":
+                        continue
+                    worker_id, _, key = message["data"].decode().partition(":")
+                    if worker_id != _WORKER_ID:
+                        local_cache.delete(key)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"cache invalidation listener failed: {e!r}")
+            await asyncio.sleep(1)
+
+
+def _start_fetch(key: str, count: int, fetch: Callable[[int], Awaitable[list[MusicItem]]]) -> asyncio.Task:
+    inflight_key = f"{key}:{count}"
+    task = _inflight.get(inflight_key)
+    if task is None:
+        task = asyncio.create_task(_fetch_once(key, count, fetch))
+        _inflight[inflight_key] = task
+        task.add_done_callback(lambda t: _fetch_done(inflight_key, t))
+    return task
+
+
+def _fetch_done(inflight_key: str, task: asyncio.Task) -> None:
+    _inflight.pop(inflight_key, None)
+    # фоновое обновление никто не ждёт - ошибку нужно хотя бы залогировать
+    if not task.cancelled() and task.exception() is not None:
+        logger.warning(f"cache refresh failed for {inflight_key}: {task.exception()!r}")
+
+
+async def _get_fresh(key: str, count: int) -> bytes | None:
+    entry, stale = await cache_lookup(key)
+    if entry is None or stale or not _entry_covers(entry, count):
         return None
-    return json.loads(data)
+    return entry
+
+
+async def _fetch_once(key: str, count: int, fetch: Callable[[int], Awaitable[list[MusicItem]]]) -> bytes:
+    lock_key = f"lock:{key}"
+    token = uuid.uuid4().hex
 
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + config.CACHE_LOCK_WAIT
+    while not await redis_client.set(lock_key, token, nx=True, ex=config.CACHE_LOCK_TTL):
+        # upstream уже опрашивает другой воркер - ждём, пока он положит свежий результат в кеш
+        await asyncio.sleep(_LOCK_POLL_INTERVAL)
+        entry = await _get_fresh(key, count)
+        if entry is not None:
+            return entry
+        if loop.time() >= deadline:
+            # держатель лока завис или упал - идём в upstream сами, без лока
+            return await cache_set(key, await fetch(count), count)
 
-async def cache_set(key: str, value: list[MusicItem]) -> None:
-    await redis_client.set(
-        key,
-        json.dumps(value, ensure_ascii=False),
-        ex=config.CACHE_TTL,
-    )
\ No newline at end of file
+    try:
+        # пока ждали лок, свежая запись могла появиться
+        entry = await _get_fresh(key, count)
+        if entry is not None:
+            return entry
+        return await cache_set(key, await fetch(count), count)
+    finally:
+        await redis_client.eval(_RELEASE_LOCK_SCRIPT, 1, lock_key, token)
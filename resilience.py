@@ -0,0 +1,209 @@
+"""
+Защита от медленного или падающего upstream: circuit breaker с общим между воркерами
+состоянием, хеджированные запросы и бюджет повторов.
+"""
+import asyncio
+import time
+from collections import deque
+from typing import Awaitable, Callable, TypeVar
+
+import redis.asyncio as redis
+from loguru import logger
+
+from utils import ExternalServiceError
+
+T = TypeVar("T")
+
+# как часто воркер перечитывает из Redis, не открыл ли breaker другой воркер
+_SYNC_INTERVAL = 1.0
+# минимум замеров для оценки p95 задержки
+_MIN_LATENCY_SAMPLES = 20
+
+
+class CircuitOpenError(ExternalServiceError):
+    pass
+
+
+class RetryBudget:
+    """
+    Повторы и хедж-запросы разрешены не чаще, чем ratio от числа обычных запросов:
+    каждый запрос добавляет ratio токена, каждый повтор тратит целый токен.
+    """
+
+    def __init__(self, ratio: float, max_tokens: float = 10):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self.tokens = 0.0
+
+    def deposit(self) -> None:
+        self.tokens = min(self.tokens + self.ratio, self.max_tokens)
+
+    def try_spend(self) -> bool:
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+class CircuitBreaker:
+    """
+    Breaker открывается, когда в скользящем окне доля ошибок или медленных вызовов превышает
+    порог. Открытое состояние пишется в Redis с TTL, поэтому видно всем воркерам.
+    После open_seconds breaker пропускает один пробный вызов (half-open).
+    """
+
+    def __init__(self,
+                 name: str,
+                 redis_client: redis.Redis,
+                 window_seconds: float,
+                 min_requests: int,
+                 error_rate: float,
+                 slow_call_seconds: float,
+                 slow_call_rate: float,
+                 open_seconds: int,
+                 retry_budget: RetryBudget,
+                 max_retries: int = 1,
+                 hedge: bool = False,
+                 ):
+        self.name = name
+        self.redis = redis_client
+        self.window = window_seconds
+        self.min_requests = min_requests
+        self.error_rate = error_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_call_rate = slow_call_rate
+        self.open_seconds = open_seconds
+        self.retry_budget = retry_budget
+        self.max_retries = max_retries
+        self.hedge = hedge
+
+        self._key = f"breaker:{name}:open"
+        # (время, успех, задержка) вызовов в пределах окна
+        self._calls: deque[tuple[float, bool, float]] = deque()
+        self._open_until = 0.0
+        self._half_open_probe = False
+        self._synced_at = 0.0
+
+    @property
+    def state(self) -> str:
+        if time.monotonic() < self._open_until:
+            return "open"
+        if self._open_until > 0:
+            return "half_open"
+        return "closed"
+
+    def p95_latency(self) -> float | None:
+        latencies = sorted(latency for _, ok, latency in self._calls if ok)
+        if len(latencies) < _MIN_LATENCY_SAMPLES:
+            return None
+        return latencies[int(len(latencies) * 0.95)]
+
+    async def call(self, fn: Callable[[], Awaitable[T]]) -> T:
+        """
+        Выполняет fn через breaker. Если breaker открыт, сразу бросает CircuitOpenError.
+        Упавший вызов повторяется, пока позволяет бюджет повторов. Вызов, отменённый снаружи
+        (deadline провайдера в asyncio.wait_for), тоже считается неудачным - иначе зависший
+        upstream никогда не откроет breaker.
+        """
+        await self._sync()
+        now = time.monotonic()
+        if now < self._open_until:
+            raise CircuitOpenError(f"{self.name} circuit is open")
+        probe = self._open_until > 0
+        if probe:
+            # half-open: пропускаем только один пробный вызов
+            if self._half_open_probe:
+                raise CircuitOpenError(f"{self.name} circuit is half-open")
+            self._half_open_probe = True
+
+        self.retry_budget.deposit()
+        attempt = 0
+        try:
+            while True:
+                start = time.monotonic()
+                try:
+                    result = await self._call_hedged(fn)
+                except asyncio.CancelledError:
+                    await self._record(False, time.monotonic() - start)
+                    raise
+                except ExternalServiceError:
+                    await self._record(False, time.monotonic() - start)
+                    attempt += 1
+                    if probe or self.state == "open" or attempt > self.max_retries \
+                            or not self.retry_budget.try_spend():
+                        raise
+                    continue
+                await self._record(True, time.monotonic() - start)
+                return result
+        finally:
+            if probe:
+                self._half_open_probe = False
+
+    async def _call_hedged(self, fn: Callable[[], Awaitable[T]]) -> T:
+        delay = self.p95_latency() if self.hedge else None
+        if delay is None:
+            return await fn()
+
+        tasks = {asyncio.create_task(fn())}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done and self.retry_budget.try_spend():
+                # первый запрос медленнее p95 - дублируем его и берём первый успешный ответ
+                tasks.add(asyncio.create_task(fn()))
+            error = None
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def _record(self, ok: bool, latency: float) -> None:
+        now = time.monotonic()
+        self._calls.append((now, ok, latency))
+        while self._calls and self._calls[0][0] < now - self.window:
+            self._calls.popleft()
+
+        if self._open_until > 0 and not ok:
+            # пробный вызов не прошёл - снова открываемся
+            await self._trip()
+            return
+        if self._open_until > 0 and ok:
+            # пробный вызов прошёл - закрываемся и начинаем окно заново
+            self._open_until = 0.0
+            self._calls.clear()
+            return
+
+        if len(self._calls) < self.min_requests:
+            return
+        failed = sum(1 for _, ok, _ in self._calls if not ok)
+        slow = sum(1 for _, _, latency in self._calls if latency >= self.slow_call_seconds)
+        if failed / len(self._calls) >= self.error_rate or slow / len(self._calls) >= self.slow_call_rate:
+            await self._trip()
+
+    async def _trip(self) -> None:
+        logger.warning(f"circuit breaker {self.name} opened for {self.open_seconds}s")
+        self._open_until = time.monotonic() + self.open_seconds
+        self._calls.clear()
+        try:
+            await self.redis.set(self._key, 1, ex=self.open_seconds)
+        except redis.RedisError as e:
+            logger.warning(f"circuit breaker {self.name} state not shared: {e!r}")
+
+    async def _sync(self) -> None:
+        now = time.monotonic()
+        if now - self._synced_at < _SYNC_INTERVAL:
+            return
+        self._synced_at = now
+        try:
+            ttl = await self.redis.ttl(self._key)
+        except redis.RedisError:
+            return
+        if ttl > 0 and now + ttl > self._open_until:
+            # breaker открыл другой воркер
+            self._open_until = now + ttl
+            self._calls.clear()
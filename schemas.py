@@ -41,6 +41,16 @@ class User(BaseModel):
     model_config = ConfigDict(from_attributes=True)
 
 
+class TokenUser(BaseModel):
+    """
+    Пользователь, восстановленный из claims access-токена без запроса к базе.
+    """
+    id: int = Field(description="Уникальный идентификатор пользователя")
+    username: str = Field(description="Логин пользователя")
+    email: str = Field(description="E-mail пользователя")
+    is_active: bool = Field(default=True)
+
+
 class Song(BaseModel):
     id: int = Field(description="Уникальный идентификатор песни")
     author: Optional[str] = Field(None, description="Автор песни")
@@ -57,7 +67,11 @@ class Song(BaseModel):
     model_config = ConfigDict(from_attributes=True)
 
 
-class SongCreate(BaseModel):
+class SongItem(BaseModel):
+    """
+    Данные песни без плейлиста.
+    Используется в массовом добавлении песен.
+    """
     author: Optional[str] = Field(None, description="Автор песни")
     name: str = Field(description="Название песни")
     album: Optional[str] = Field(None, description="Альбом")
@@ -66,7 +80,19 @@ class SongCreate(BaseModel):
     duration: int = Field(description="Длительность в секундах")
     album_cover_url: Optional[str] = Field(None, max_length=200, description="URL изображения альбома")
     url: str = Field(max_length=200, description="URL песни")
+
+
+class SongCreate(SongItem):
+    playlist_id: int = Field(description="ID плейлиста")
+
+
+class SongBulkCreate(BaseModel):
+    """
+    Модель для массового добавления песен в плейлист.
+    Используется в POST /songs/bulk.
+    """
     playlist_id: int = Field(description="ID плейлиста")
+    songs: list[SongItem] = Field(min_length=1, max_length=5000, description="Песни (не больше 5000)")
 
 
 class PlaylistCreate(BaseModel):
@@ -0,0 +1,33 @@
+import os
+from pathlib import Path
+
+import fakeredis
+import pytest
+from dotenv import load_dotenv
+
+# настройки из примера окружения; load_dotenv в config не перезапишет уже заданные переменные
+load_dotenv(Path(__file__).parent.parent / ".example.env")
+# тесты не пишут logs/main.log
+os.environ["LOG_FILE"] = ""
+
+
+@pytest.fixture
+def fake_redis():
+    return fakeredis.FakeAsyncRedis()
+
+
+@pytest.fixture
+def app(fake_redis, monkeypatch):
+    """Приложение, у которого лимитер запросов работает с fakeredis."""
+    import main
+    from middlewares import ThrottlingMiddleware
+    from rate_limit import RateLimiter
+
+    for middleware in main.app.user_middleware:
+        if middleware.cls is ThrottlingMiddleware:
+            monkeypatch.setitem(middleware.kwargs, "limiter", RateLimiter(fake_redis, main.throttling_rules))
+            monkeypatch.setitem(middleware.kwargs, "local_limiter", None)
+    # стек middleware собирается при первом запросе - пересобираем с подменёнными аргументами
+    main.app.middleware_stack = None
+    yield main.app
+    main.app.middleware_stack = None
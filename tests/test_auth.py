@@ -0,0 +1,108 @@
+import asyncio
+import time
+
+import fakeredis
+import httpx
+import pytest
+
+import auth
+from auth import create_access_token, revoke_user
+
+
+@pytest.fixture
+def stateless_app(app, fake_redis, monkeypatch):
+    monkeypatch.setattr(auth, "redis_client", fake_redis)
+    monkeypatch.setattr(auth, "AUTH_STATELESS", True)
+    monkeypatch.setattr(auth, "_revoked_users", {})
+    monkeypatch.setattr(auth, "_revoked_tokens", set())
+    monkeypatch.setattr(auth, "_revoked_synced_at", 0.0)
+    return app
+
+
+def make_token(user_id: int = 1) -> str:
+    return create_access_token({"sub": f"user{user_id}@example.com", "id": user_id, "username": f"user{user_id}"})
+
+
+async def search(app, token: str) -> httpx.Response:
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test",
+                                 cookies={"access_token": token}) as client:
+        # без провайдеров обработчик не ходит ни в кеш, ни в upstream
+        return await client.get("/search", params={"q": "test", "mailru": False, "vk": False})
+
+
+def test_revoked_user_gets_401_on_search(stateless_app):
+    async def run():
+        token = make_token()
+        before = await search(stateless_app, token)
+        await revoke_user(1)
+        after = await search(stateless_app, token)
+        return before.status_code, after.status_code
+
+    assert asyncio.run(run()) == (200, 401)
+
+
+def test_token_issued_after_revocation_accepted(stateless_app):
+    async def run():
+        old_token = make_token()
+        await revoke_user(1)
+        # воркер, не видевший отзыв, узнаёт о нём из Redis
+        auth._revoked_users.clear()
+        auth._revoked_synced_at = 0.0
+        old = await search(stateless_app, old_token)
+        new = await search(stateless_app, make_token())
+        return old.status_code, new.status_code
+
+    assert asyncio.run(run()) == (401, 200)
+
+
+def test_search_served_from_last_revocation_list_when_redis_is_down(stateless_app, monkeypatch):
+    server = fakeredis.FakeServer()
+    server.connected = False
+    broken = fakeredis.FakeAsyncRedis(server=server)
+    pipelines = []
+    pipeline = broken.pipeline
+
+    def counting_pipeline(*args, **kwargs):
+        pipelines.append(args)
+        return pipeline(*args, **kwargs)
+
+    monkeypatch.setattr(broken, "pipeline", counting_pipeline)
+    monkeypatch.setattr(auth, "redis_client", broken)
+    # отзыв пользователя 2, полученный до отказа Redis
+    monkeypatch.setattr(auth, "_revoked_users", {2: time.time() + 60})
+
+    async def run():
+        allowed = await search(stateless_app, make_token())
+        revoked = await search(stateless_app, make_token(user_id=2))
+        return allowed.status_code, revoked.status_code
+
+    assert asyncio.run(run()) == (200, 401)
+    # второй запрос не повторяет синхронизацию с недоступным Redis
+    assert len(pipelines) == 1
+
+
+async def logout(app, token: str) -> httpx.Response:
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test",
+                                 cookies={"access_token": token}) as client:
+        return await client.post("/users/logout")
+
+
+def test_logout_revokes_only_presented_token(stateless_app):
+    async def run():
+        laptop, phone = make_token(), make_token()
+        response = await logout(stateless_app, laptop)
+        return response.status_code, (await search(stateless_app, laptop)).status_code, \
+            (await search(stateless_app, phone)).status_code
+
+    assert asyncio.run(run()) == (200, 401, 200)
+
+
+def test_logout_without_stateless_auth_does_not_touch_redis(stateless_app, monkeypatch):
+    server = fakeredis.FakeServer()
+    server.connected = False
+    monkeypatch.setattr(auth, "redis_client", fakeredis.FakeAsyncRedis(server=server))
+    monkeypatch.setattr(auth, "AUTH_STATELESS", False)
+
+    response = asyncio.run(logout(stateless_app, make_token()))
+    assert response.status_code == 200
+    assert auth._revoked_tokens == set()
@@ -0,0 +1,55 @@
+import asyncio
+
+import httpx
+
+from http_client import InstrumentedTransport, upstream_pool_stats
+
+
+class StreamingBody(httpx.AsyncByteStream):
+    async def __aiter__(self):
+        yield b"[1, 2]"
+
+
+def test_in_flight_released_when_response_closed():
+    transport = InstrumentedTransport(httpx.MockTransport(lambda request: httpx.Response(200, stream=StreamingBody())))
+
+    async def run():
+        async with httpx.AsyncClient(transport=transport) as client:
+            async with client.stream("GET", "http://upstream/") as response:
+                in_flight = transport.in_flight
+                await response.aread()
+            return in_flight
+
+    assert asyncio.run(run()) == 1
+    stats = upstream_pool_stats(transport)
+    assert stats["in_flight"] == 0
+    assert stats["requests"] == 1
+
+
+def test_pool_timeout_counted():
+    def handler(request):
+        raise httpx.PoolTimeout("no free connection")
+
+    transport = InstrumentedTransport(httpx.MockTransport(handler))
+
+    async def run():
+        async with httpx.AsyncClient(transport=transport) as client:
+            try:
+                await client.get("http://upstream/")
+            except httpx.PoolTimeout:
+                pass
+
+    asyncio.run(run())
+    assert transport.pool_timeouts == 1
+    assert transport.in_flight == 0
+
+
+def test_pre_read_response_released():
+    transport = InstrumentedTransport(httpx.MockTransport(lambda request: httpx.Response(200, json=[1, 2])))
+
+    async def run():
+        async with httpx.AsyncClient(transport=transport) as client:
+            return (await client.get("http://upstream/")).json()
+
+    assert asyncio.run(run()) == [1, 2]
+    assert transport.in_flight == 0
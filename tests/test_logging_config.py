@@ -0,0 +1,45 @@
+import asyncio
+import random
+
+import pytest
+from loguru import logger
+
+from benchmarks.query_normalization_report import parse_line
+from logging_config import _sampling_filter, create_sink
+
+
+@pytest.fixture
+def outputs():
+    first, second = [], []
+    logger.remove()
+    yield first, second
+    logger.remove()
+
+
+def log_queries(sink, rate: float = 1.0) -> None:
+    logger.add(sink, level="DEBUG", format=lambda record: "", filter=_sampling_filter({"DEBUG": rate}))
+    for i in range(200):
+        logger.debug("query={}; mail.ru={}; vk={};", f"song {i}", True, False)
+
+    async def complete():
+        await logger.complete()
+
+    asyncio.run(complete())
+
+
+def test_sampled_once_for_all_outputs(outputs):
+    first, second = outputs
+    random.seed(1)
+    log_queries(create_sink(False, (first.append, {}), (second.append, {})), rate=0.5)
+    assert 0 < len("".join(first).splitlines()) < 200
+    assert "".join(first) == "".join(second)
+
+
+@pytest.mark.parametrize("serialize", [False, True])
+def test_query_report_reads_both_formats(outputs, serialize):
+    first, _ = outputs
+    log_queries(create_sink(serialize, (first.append, {})))
+    lines = "".join(first).splitlines()
+    parsed = [parse_line(line) for line in lines]
+    assert len(parsed) == 200 and all(parsed)
+    assert parsed[0][1]["q"] == "song 0"
@@ -0,0 +1,47 @@
+import asyncio
+
+import httpx
+import pytest
+from fastapi import HTTPException
+
+import config
+from main import require_metrics_token
+
+
+async def get(app, path: str, headers: dict | None = None) -> httpx.Response:
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        return await client.get(path, headers=headers)
+
+
+@pytest.mark.parametrize("path", ["/stats", "/metrics"])
+def test_metrics_require_token(app, monkeypatch, path):
+    monkeypatch.setattr(config, "METRICS_TOKEN", "secret")
+    assert asyncio.run(get(app, path)).status_code == 401
+    response = asyncio.run(get(app, path, {"Authorization": "Bearer wrong"}))
+    assert response.status_code == 401
+    assert response.headers["WWW-Authenticate"] == "Bearer"
+
+
+def test_metrics_with_token(app, monkeypatch):
+    monkeypatch.setattr(config, "METRICS_TOKEN", "secret")
+    assert asyncio.run(get(app, "/metrics", {"Authorization": "Bearer secret"})).status_code == 200
+
+
+@pytest.mark.parametrize("authorization", [None, "Bearer wrong", "Basic secret", "secret", "Bearer"])
+def test_require_metrics_token_rejects(monkeypatch, authorization):
+    monkeypatch.setattr(config, "METRICS_TOKEN", "secret")
+    with pytest.raises(HTTPException) as e:
+        require_metrics_token(authorization)
+    assert e.value.status_code == 401
+
+
+def test_require_metrics_token_accepts_any_scheme_case(monkeypatch):
+    monkeypatch.setattr(config, "METRICS_TOKEN", "secret")
+    require_metrics_token("Bearer secret")
+    require_metrics_token("bearer secret")
+
+
+def test_metrics_open_when_token_empty(app, monkeypatch):
+    monkeypatch.setattr(config, "METRICS_TOKEN", "")
+    require_metrics_token(None)
+    assert asyncio.run(get(app, "/metrics")).status_code == 200
@@ -0,0 +1,34 @@
+import os
+import time
+
+from profiling import _prune_profiles
+
+
+def make_profiles(tmp_path, ages: list[float]) -> list:
+    now = time.time()
+    paths = []
+    for i, age in enumerate(ages):
+        path = tmp_path / f"{i}.speedscope.json"
+        path.write_text("{}")
+        os.utime(path, (now - age, now - age))
+        paths.append(path)
+    return paths
+
+
+def test_keeps_newest_max_files(tmp_path):
+    paths = make_profiles(tmp_path, [30, 10, 20, 40])
+    _prune_profiles(tmp_path, max_files=2, max_age=0)
+    assert sorted(p.name for p in tmp_path.iterdir()) == [paths[1].name, paths[2].name]
+
+
+def test_removes_older_than_max_age(tmp_path):
+    paths = make_profiles(tmp_path, [10, 7200])
+    _prune_profiles(tmp_path, max_files=0, max_age=3600)
+    assert [p.name for p in tmp_path.iterdir()] == [paths[0].name]
+
+
+def test_other_files_untouched(tmp_path):
+    (tmp_path / "notes.txt").write_text("")
+    make_profiles(tmp_path, [10, 20])
+    _prune_profiles(tmp_path, max_files=1, max_age=0)
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["0.speedscope.json", "notes.txt"]
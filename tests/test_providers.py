@@ -0,0 +1,41 @@
+import asyncio
+
+import pytest
+
+from providers import SearchProvider, federated_search
+from utils import DegradedResults, ExternalServiceError
+
+
+class StaticProvider(SearchProvider):
+    def __init__(self, name: str, items: list | None):
+        super().__init__(deadline=1)
+        self.name = name
+        self.items = items
+
+    async def search(self, query: str, count: int):
+        if self.items is None:
+            raise ExternalServiceError(f"{self.name} is down")
+        return self.items[:count]
+
+
+def track(name: str) -> dict:
+    return {"author": "artist", "name": name, "duration": 100}
+
+
+def test_search_provider_is_abstract():
+    with pytest.raises(TypeError):
+        SearchProvider(deadline=1)
+
+
+def test_all_providers_answered():
+    providers = [StaticProvider("a", [track("x")]), StaticProvider("b", [track("y")])]
+    result = asyncio.run(federated_search(providers, "q", 10))
+    assert not isinstance(result, DegradedResults)
+    assert len(result) == 2
+
+
+def test_failed_provider_marks_result_degraded():
+    providers = [StaticProvider("a", [track("x")]), StaticProvider("b", None)]
+    result = asyncio.run(federated_search(providers, "q", 10))
+    assert isinstance(result, DegradedResults)
+    assert result == [track("x")]
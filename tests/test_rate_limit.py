@@ -0,0 +1,111 @@
+import asyncio
+
+import fakeredis
+import httpx
+import pytest
+import redis
+from fastapi import FastAPI
+from starlette.requests import HTTPConnection
+
+from middlewares import ThrottlingMiddleware
+from rate_limit import RateLimiter, client_ip, match_rule, parse_rules
+
+RULES = parse_rules("/users/login=2/60;/search=5/10", 100, 60)
+
+
+def make_app(limiter, trusted_hops: int = 0) -> FastAPI:
+    app = FastAPI()
+
+    @app.api_route("/{path:path}", methods=["GET", "POST"])
+    async def echo(path: str):
+        return {"path": path}
+
+    app.add_middleware(ThrottlingMiddleware, limiter=limiter, trusted_hops=trusted_hops)
+    return app
+
+
+async def send(app, path: str, times: int = 1, headers: dict | None = None) -> list[httpx.Response]:
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        return [await client.post(path, headers=headers) for _ in range(times)]
+
+
+def make_connection(xff: str | None, peer: str = "10.0.0.2") -> HTTPConnection:
+    headers = [(b"x-forwarded-for", xff.encode())] if xff is not None else []
+    return HTTPConnection({"type": "http", "headers": headers, "client": (peer, 1234), "path": "/"})
+
+
+def test_allow_then_deny_with_headers():
+    app = make_app(RateLimiter(fakeredis.FakeAsyncRedis(), RULES))
+    first, second, third = asyncio.run(send(app, "/users/login", times=3))
+
+    assert first.status_code == second.status_code == 200
+    assert first.headers["RateLimit-Limit"] == "2"
+    assert first.headers["RateLimit-Remaining"] == "1"
+    assert second.headers["RateLimit-Remaining"] == "0"
+    assert "Retry-After" not in second.headers
+
+    assert third.status_code == 429
+    assert third.headers["RateLimit-Remaining"] == "0"
+    # следующий запрос разрешится через period / limit = 30 секунд
+    assert 29 <= int(third.headers["Retry-After"]) <= 30
+
+
+def test_prefixes_have_separate_limits():
+    app = make_app(RateLimiter(fakeredis.FakeAsyncRedis(), RULES))
+
+    async def run():
+        await send(app, "/users/login", times=2)
+        return (await send(app, "/users/login"))[0], (await send(app, "/search"))[0], (await send(app, "/songs"))[0]
+
+    login, search, songs = asyncio.run(run())
+    assert login.status_code == 429
+    assert search.status_code == 200 and search.headers["RateLimit-Limit"] == "5"
+    assert songs.status_code == 200 and songs.headers["RateLimit-Limit"] == "100"
+
+
+@pytest.mark.parametrize("path, prefix", [
+    ("/users/login", "/users/login"),
+    ("/users/login/", "/users/login"),
+    ("/users/loginx", ""),
+    ("/users/login-history", ""),
+    ("/search", "/search"),
+    ("/searching", ""),
+    ("/", ""),
+])
+def test_match_rule_on_path_segments(path, prefix):
+    assert match_rule(RULES, path).prefix == prefix
+
+
+def test_client_ip_ignores_forwarded_for_without_trusted_hops():
+    assert client_ip(make_connection("1.1.1.1"), 0) == "10.0.0.2"
+
+
+def test_client_ip_takes_address_added_by_proxy():
+    assert client_ip(make_connection("1.1.1.1"), 1) == "1.1.1.1"
+    # клиент сам прислал X-Forwarded-For, nginx дописал его настоящий адрес в конец
+    assert client_ip(make_connection("6.6.6.6, 1.1.1.1"), 1) == "1.1.1.1"
+    # заголовка нет - запрос пришёл не через прокси
+    assert client_ip(make_connection(None), 1) == "10.0.0.2"
+
+
+def test_spoofed_forwarded_for_does_not_bypass_limit():
+    app = make_app(RateLimiter(fakeredis.FakeAsyncRedis(), RULES), trusted_hops=1)
+
+    async def run():
+        responses = []
+        for i in range(3):
+            responses += await send(app, "/users/login", headers={"X-Forwarded-For": f"6.6.6.{i}, 1.1.1.1"})
+        return responses
+
+    assert [r.status_code for r in asyncio.run(run())] == [200, 200, 429]
+
+
+class BrokenLimiter:
+    async def hit(self, identity: str, path: str, probe_key: str | None = None):
+        raise redis.ConnectionError("redis is down")
+
+
+def test_fail_open_when_redis_is_down():
+    response, = asyncio.run(send(make_app(BrokenLimiter()), "/users/login"))
+    assert response.status_code == 200
+    assert "RateLimit-Limit" not in response.headers
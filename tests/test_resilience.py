@@ -0,0 +1,45 @@
+import asyncio
+
+import fakeredis
+
+from providers import SearchProvider, _search_within_deadline
+from resilience import CircuitBreaker, RetryBudget
+from utils import ExternalServiceError
+
+
+class HungProvider(SearchProvider):
+    name = "hung"
+
+    def __init__(self, breaker: CircuitBreaker, deadline: float):
+        super().__init__(deadline)
+        self.breaker = breaker
+
+    async def search(self, query: str, count: int):
+        # upstream принял соединение и молчит
+        return await self.breaker.call(lambda: asyncio.sleep(3600))
+
+
+def make_breaker() -> CircuitBreaker:
+    return CircuitBreaker("hung", fakeredis.FakeAsyncRedis(), window_seconds=30, min_requests=5, error_rate=0.5,
+                          slow_call_seconds=3, slow_call_rate=0.5, open_seconds=15,
+                          retry_budget=RetryBudget(0.1))
+
+
+def test_deadline_timeouts_open_breaker():
+    breaker = make_breaker()
+    provider = HungProvider(breaker, deadline=0.01)
+
+    async def run():
+        errors = []
+        for _ in range(10):
+            try:
+                await _search_within_deadline(provider, "q", 10)
+            except ExternalServiceError as e:
+                errors.append(e)
+        return errors
+
+    errors = asyncio.run(run())
+    assert len(errors) == 10
+    assert breaker.state == "open"
+    # после открытия запросы отклоняются сразу, без ожидания deadline
+    assert "circuit" in str(errors[-1])
@@ -0,0 +1,91 @@
+import asyncio
+
+import fakeredis
+import orjson
+import pytest
+
+import redis_cache
+from utils import DegradedResults
+
+
+@pytest.fixture
+def fake_redis(monkeypatch):
+    client = fakeredis.FakeAsyncRedis()
+    monkeypatch.setattr(redis_cache, "redis_client", client)
+    redis_cache.local_cache.clear()
+    redis_cache._inflight.clear()
+    yield client
+    redis_cache.local_cache.clear()
+
+
+def make_fetch(calls: list[int], delay: float = 0.2):
+    async def fetch(count: int):
+        calls.append(count)
+        await asyncio.sleep(delay)
+        return [{"name": f"song {i}"} for i in range(count)]
+
+    return fetch
+
+
+def test_concurrent_misses_in_worker_fetch_once(fake_redis):
+    calls = []
+    fetch = make_fetch(calls)
+    key = redis_cache.make_cache_key("rammstein", "mailru")
+
+    async def run():
+        return await asyncio.gather(*(redis_cache.cache_get_or_fetch(key, 10, fetch) for _ in range(20)))
+
+    results = asyncio.run(run())
+
+    assert len(calls) == 1
+    assert all(orjson.loads(result) == orjson.loads(results[0]) for result in results)
+    assert len(orjson.loads(results[0])) == 10
+
+
+def test_concurrent_misses_across_workers_fetch_once(fake_redis):
+    # у каждого воркера своя задача на ключ (_inflight не общий) - их развязывает Redis-лок
+    calls = []
+    fetch = make_fetch(calls)
+    key = redis_cache.make_cache_key("rammstein", "mailru")
+
+    async def run():
+        return await asyncio.gather(*(redis_cache._fetch_once(key, 10, fetch) for _ in range(8)))
+
+    entries = asyncio.run(run())
+
+    assert len(calls) == 1
+    assert len(set(entries)) == 1
+
+
+def test_smaller_request_served_from_larger_entry(fake_redis):
+    calls = []
+    fetch = make_fetch(calls, delay=0)
+    key = redis_cache.make_cache_key("rammstein", "mailru")
+
+    async def run():
+        await redis_cache.cache_get_or_fetch(key, 50, fetch)
+        redis_cache.local_cache.clear()
+        return await redis_cache.cache_get_or_fetch(key, 5, fetch)
+
+    result = asyncio.run(run())
+
+    assert calls == [50]
+    assert len(orjson.loads(result)) == 5
+
+
+def test_degraded_result_fresh_only_for_degraded_ttl(fake_redis, monkeypatch):
+    monkeypatch.setattr(redis_cache.config, "CACHE_SOFT_TTL", 60)
+    monkeypatch.setattr(redis_cache.config, "CACHE_HARD_TTL", 600)
+    monkeypatch.setattr(redis_cache.config, "CACHE_DEGRADED_TTL", 30)
+
+    async def run():
+        await redis_cache.cache_set("search:full", [{"name": "a"}], 10)
+        await redis_cache.cache_set("search:degraded", DegradedResults([{"name": "a"}]), 10)
+        return await fake_redis.ttl("search:full"), await fake_redis.ttl("search:degraded")
+
+    full_ttl, degraded_ttl = asyncio.run(run())
+    assert full_ttl == 600
+    # устареет через CACHE_DEGRADED_TTL секунд, а не через CACHE_SOFT_TTL
+    assert degraded_ttl == 600 - 60 + 30
+    assert not redis_cache._lookup_result(b"1:1:[]", degraded_ttl - 29)[1]
+    assert redis_cache._lookup_result(b"1:1:[]", degraded_ttl - 31)[1]
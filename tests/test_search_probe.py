@@ -0,0 +1,84 @@
+import asyncio
+
+import httpx
+import orjson
+import pytest
+
+import redis_cache
+from auth import get_token_user
+from schemas import TokenUser
+
+QUERY = "cached query"
+
+
+@pytest.fixture
+def search_app(app, fake_redis, monkeypatch):
+    monkeypatch.setattr(redis_cache, "redis_client", fake_redis)
+    monkeypatch.setitem(app.dependency_overrides, get_token_user,
+                        lambda: TokenUser(id=1, email="user@example.com", username="user"))
+    # провайдеры не должны вызываться: ответ есть в кеше
+    monkeypatch.setattr(app.state, "providers", {"mailru": None}, raising=False)
+    redis_cache.local_cache.clear()
+    yield app
+    redis_cache.local_cache.clear()
+
+
+@pytest.fixture
+def redis_commands(fake_redis, monkeypatch):
+    """Команды, отправленные в Redis: (имя, аргументы); пайплайн - одна запись ("PIPELINE", ())."""
+    commands = []
+    execute_command = fake_redis.execute_command
+    pipeline = fake_redis.pipeline
+
+    async def counting_execute_command(*args, **kwargs):
+        commands.append((args[0], args[1:]))
+        return await execute_command(*args, **kwargs)
+
+    def counting_pipeline(*args, **kwargs):
+        commands.append(("PIPELINE", ()))
+        return pipeline(*args, **kwargs)
+
+    monkeypatch.setattr(fake_redis, "execute_command", counting_execute_command)
+    monkeypatch.setattr(fake_redis, "pipeline", counting_pipeline)
+    return commands
+
+
+async def search(app) -> httpx.Response:
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        return await client.get("/search", params={"q": QUERY})
+
+
+def test_cached_search_served_from_limiter_round_trip(search_app, redis_commands):
+    items = [{"name": f"song {i}"} for i in range(3)]
+
+    async def run():
+        await redis_cache.cache_set(redis_cache.make_cache_key(QUERY, "mailru"), items, 100)
+        # первый вызов загружает Lua-скрипт лимитера
+        await search(search_app)
+        redis_cache.local_cache.clear()
+        redis_commands.clear()
+        return await search(search_app)
+
+    response = asyncio.run(run())
+    assert response.status_code == 200
+    assert orjson.loads(response.content) == items
+    # проверка лимита и чтение кеша - один EVALSHA с двумя ключами, без отдельного GET/TTL
+    assert [name for name, _ in redis_commands] == ["EVALSHA"]
+    assert redis_commands[0][1][1] == 2
+
+
+def test_l1_hit_skips_probe(search_app, redis_commands):
+    items = [{"name": "song"}]
+
+    async def run():
+        # cache_set кладёт запись и в L1
+        await redis_cache.cache_set(redis_cache.make_cache_key(QUERY, "mailru"), items, 100)
+        await search(search_app)
+        redis_commands.clear()
+        return await search(search_app)
+
+    response = asyncio.run(run())
+    assert orjson.loads(response.content) == items
+    # ключ кеша лимитеру не передаётся, в Redis - только проверка лимита
+    assert [name for name, _ in redis_commands] == ["EVALSHA"]
+    assert redis_commands[0][1][1] == 1
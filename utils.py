@@ -1,5 +1,6 @@
 from vkpymusic import TokenReceiver, Service
 import os
+import unicodedata
 import httpx
 from typing import TypedDict
 
@@ -15,6 +16,13 @@ class MusicItem(TypedDict):
     url: str
 
 
+class DegradedResults(list):
+    """
+    Выдача федеративного поиска, в которой не хватает части провайдеров (упали или не успели).
+    Кешируется ненадолго, чтобы не отдавать неполный ответ весь срок жизни записи.
+    """
+
+
 class ExternalServiceError(RuntimeError):
     pass
 
@@ -30,37 +38,56 @@ def convert_song_duration(seconds: int) -> str:
     return f'{mins:0>2}:{secs:0>2}'
 
 
-def vk_search(query: str, count=100) -> dict:
+_TRANSLIT = str.maketrans({
+    'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'д': 'd', 'е': 'e', 'ё': 'e', 'ж': 'zh', 'з': 'z',
+    'и': 'i', 'й': 'i', 'к': 'k', 'л': 'l', 'м': 'm', 'н': 'n', 'о': 'o', 'п': 'p', 'р': 'r',
+    'с': 's', 'т': 't', 'у': 'u', 'ф': 'f', 'х': 'h', 'ц': 'ts', 'ч': 'ch', 'ш': 'sh', 'щ': 'sch',
+    'ъ': '', 'ы': 'y', 'ь': '', 'э': 'e', 'ю': 'yu', 'я': 'ya',
+})
+
+
+def normalize_query(query: str, translit: bool = False) -> str:
+    """
+    Приводит поисковый запрос к каноническому виду для ключа кеша:
+    NFKC, casefold, схлопывание пробелов. С translit кириллица транслитерируется в латиницу,
+    чтобы "Раммштайн" и "rammshtain" давали один ключ.
+    :param query:
+    :param translit:
+    :return:
+    """
+    query = ' '.join(unicodedata.normalize('NFKC', query).casefold().split())
+    if translit:
+        query = query.translate(_TRANSLIT)
+    return query
+
+
+def vk_search(query: str, count=100) -> list[MusicItem]:
     # Для ручного получения токена
     # https://oauth.vk.com/authorize?client_id=2685278&scope=audio&redirect_uri=https://oauth.vk.com/blank.html&display=page&response_type=token
+    # Синхронная (блокирующая) функция - из async-кода вызывать только в пуле потоков
     service = Service(os.getenv('VK_USER_AGENT'), os.getenv('VK_TOKEN'))
     try:
         songs = service.search_songs_by_text(text=query, count=count)
-
-        result = {}
-        counter = 0
-        try:
-            for song in songs:
-                result[f"v{counter}"] = {'name': song.title,
-                                         'author': song.artist,
-                                         'album': None,
-                                         'bitrate': None,
-                                         'duration_text': convert_song_duration(song.duration),
-                                         'duration': song.duration,
-                                         'album_cover_url': None,
-                                         'url': song.url
-                                         }
-                counter += 1
-        except Exception:
-            pass
-
-        return result
     except Exception as e:
-        print(e)
-        return {}
+        raise ExternalServiceError("VK request failed") from e
+
+    result: list[MusicItem] = []
+    for song in songs or []:
+        result.append({'name': song.title,
+                       'author': song.artist,
+                       'album': None,
+                       'bitrate': None,
+                       'duration_text': convert_song_duration(song.duration),
+                       'duration': song.duration,
+                       'album_cover_url': None,
+                       'url': song.url
+        })
+
+    return result
 
 
-async def mail_ru_search(client: httpx.AsyncClient, query: str, count: int =100) -> list[MusicItem]:
+async def mail_ru_search(client: httpx.AsyncClient, query: str, count: int =100,
+                         url: str = 'https://my.mail.ru/cgi-bin/my/ajax') -> list[MusicItem]:
     if not query:
         return []
 
@@ -93,7 +120,7 @@ async def mail_ru_search(client: httpx.AsyncClient, query: str, count: int =100)
     }
 
     try:
-        resp = await client.get('https://my.mail.ru/cgi-bin/my/ajax', params=params, headers=headers)
+        resp = await client.get(url, params=params, headers=headers)
         resp.raise_for_status()
         resp_data = resp.json()
     except httpx.HTTPError as e: